@@ -0,0 +1,248 @@
+# analytics.py
+import argparse
+import contextlib
+import json
+import math
+import sys
+from array import array
+from datetime import date
+from itertools import accumulate, compress
+from operator import mul, sub
+
+from data_manager import DataManager
+
+try:
+    import numpy as np
+except ImportError:  # 没有安装 NumPy 时用标准库 array 实现同样的计算
+    np = None
+
+# 支持分析的字段
+ANALYTICS_METRICS = ("wpm_estimated", "speed")
+
+
+def _day_ordinals(timestamps):#"YYYY-MM-DD HH:MM:SS" -> 日期序号，无法解析时为 0（同一天只解析一次）
+    cache = {}
+    ordinals = array("q")
+    for timestamp in timestamps:
+        key = timestamp[:10] if timestamp else None
+        ordinal = cache.get(key)
+        if ordinal is None:
+            try:
+                ordinal = date.fromisoformat(key).toordinal()
+            except (TypeError, ValueError):
+                ordinal = 0
+            cache[key] = ordinal
+        ordinals.append(ordinal)
+    return ordinals
+
+
+class MetricSeries:
+    # 一个统计字段的全部有效值（按保存顺序）及每个值对应的日期序号
+    # 有 NumPy 时为 ndarray，否则为 array("d") / array("q")
+
+    def __init__(self, raw_values, day_ordinals):
+        mask = [value is not None for value in raw_values]
+        if np is not None:
+            self.values = np.fromiter(compress(raw_values, mask), dtype=np.float64)
+            self.days = np.fromiter(compress(day_ordinals, mask), dtype=np.int64)
+        else:
+            self.values = array("d", compress(raw_values, mask))
+            self.days = array("q", compress(day_ordinals, mask))
+
+    def __len__(self):
+        return len(self.values)
+
+
+class HistoryColumns:
+    # 按列保存的历史记录：timestamp 转成日期序号，每个统计字段一个 MetricSeries
+
+    def __init__(self, columns):
+        timestamps = columns.get("timestamp", [])
+        days = _day_ordinals(timestamps)
+        self.count = len(timestamps)
+        self.series = {}
+        for field, values in columns.items():
+            if field != "timestamp":
+                self.series[field] = MetricSeries(values, days)
+
+    @classmethod
+    def from_data_manager(cls, data_manager, metrics=ANALYTICS_METRICS):
+        return cls(data_manager.get_columns(("timestamp",) + tuple(metrics))) # 调用data_manager包
+
+
+def rolling_mean(values, window=10):#每次测试及其之前共window次的平均值（开头不足window次时取已有的）
+    if window <= 0:
+        raise ValueError("window 必须大于 0")
+    n = len(values)
+    if np is not None:
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        ends = np.arange(1, n + 1)
+        starts = np.maximum(ends - window, 0)
+        return (sums[ends] - sums[starts]) / (ends - starts)
+    sums = [0.0]
+    sums.extend(accumulate(values))
+    head = min(window, n)
+    result = array("d", [sums[i] / i for i in range(1, head + 1)])
+    # 之后每个位置都是 (sums[i] - sums[i - window]) / window，用 map 在 C 层逐元素计算
+    scale = 1.0 / window
+    result.extend(map(scale.__mul__, map(sub, sums[head + 1:], sums[1:n - window + 1])))
+    return result
+
+
+def percentiles(values, qs=(50, 90, 99)):#百分位数（线性插值，与 numpy.percentile 默认方法一致），返回 {q: 值}
+    n = len(values)
+    if n == 0:
+        return {}
+    if np is not None:
+        return {q: float(v) for q, v in zip(qs, np.percentile(values, qs))}
+
+    ordered = sorted(values)
+    result = {}
+    for q in qs:
+        position = (n - 1) * q / 100
+        low = int(position)
+        high = min(low + 1, n - 1)
+        result[q] = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+    return result
+
+
+def daily_aggregates(values, days):#按天统计次数、平均值和最大值，日期无法解析的记录不参与
+    if np is not None:
+        valid = days > 0
+        values = values[valid]
+        days = days[valid]
+        if len(days) == 0:
+            return []
+        order = np.argsort(days, kind="stable")
+        days = days[order]
+        values = values[order]
+        starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+        counts = np.diff(np.concatenate((starts, [len(days)])))
+        sums = np.add.reduceat(values, starts)
+        maximums = np.maximum.reduceat(values, starts)
+        groups = zip(days[starts].tolist(), counts.tolist(), sums.tolist(), maximums.tolist())
+    else:
+        totals = {}
+        for day, value in zip(days, values):
+            if day <= 0:
+                continue
+            entry = totals.get(day)
+            if entry is None:
+                totals[day] = [1, value, value]
+            else:
+                entry[0] += 1
+                entry[1] += value
+                if value > entry[2]:
+                    entry[2] = value
+        groups = ((day, *totals[day]) for day in sorted(totals))
+
+    return [
+        {"day": date.fromordinal(day).isoformat(), "count": count,
+         "mean": round(total / count, 2), "max": round(maximum, 2)}
+        for day, count, total, maximum in groups
+    ]
+
+
+def personal_best_curve(values):#截至每次测试的历史最好成绩
+    if np is not None:
+        return np.maximum.accumulate(values) if len(values) else values
+    return array("d", accumulate(values, max))
+
+
+def linear_trend(values):#最小二乘拟合 值 = slope * 测试序号 + intercept，返回 (slope, intercept)
+    n = len(values)
+    if n == 0:
+        return 0.0, 0.0
+    if n == 1:
+        return 0.0, float(values[0])
+    if np is not None:
+        sum_y = float(values.sum())
+        sum_xy = float(np.dot(np.arange(n, dtype=np.float64), values))
+    else:
+        sum_y = math.fsum(values)
+        sum_xy = math.fsum(map(mul, range(n), values))
+    # 序号 0..n-1 的和与平方和有闭式
+    sum_x = n * (n - 1) / 2
+    sum_xx = (n - 1) * n * (2 * n - 1) / 6
+    slope = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x * sum_x)
+    intercept = (sum_y - slope * sum_x) / n
+    return slope, intercept
+
+
+def summarize(history, metric="wpm_estimated", window=10, qs=(50, 90, 99)):#一个字段的完整统计，结果只含普通 Python 类型
+    series = history.series[metric]
+    n = len(series)
+    if n == 0:
+        return {"metric": metric, "count": 0}
+
+    values = series.values
+    rolling = rolling_mean(values, window)
+    best = personal_best_curve(values)
+    slope, intercept = linear_trend(values)
+    if np is not None:
+        mean = float(values.mean())
+        best_updates = int(np.count_nonzero(np.diff(best) > 0)) + 1
+    else:
+        mean = math.fsum(values) / n
+        best_updates = sum(1 for previous, current in zip(best, best[1:]) if current > previous) + 1
+
+    return {
+        "metric": metric,
+        "count": n,
+        "mean": round(mean, 2),
+        "rolling_mean": round(float(rolling[-1]), 2),   # 最近window次的平均值
+        "percentiles": {q: round(v, 2) for q, v in percentiles(values, qs).items()},
+        "personal_best": round(float(best[-1]), 2),
+        "personal_best_updates": best_updates,           # 刷新个人最好成绩的次数
+        "trend_slope": round(slope, 4),                  # 每次测试的平均变化
+        "trend_intercept": round(intercept, 2),
+        "daily": daily_aggregates(values, series.days),
+    }
+
+
+def format_report(summary, days=7):#把 summarize 的结果格式化为文本报告
+    if not summary["count"]:
+        return f"[{summary['metric']}] 暂无数据"
+    lines = [
+        f"[{summary['metric']}] 共 {summary['count']} 次测试",
+        f"  平均: {summary['mean']}  最近平均: {summary['rolling_mean']}  个人最好: {summary['personal_best']}"
+        f"（刷新 {summary['personal_best_updates']} 次）",
+        "  百分位: " + "  ".join(f"P{q}: {v}" for q, v in summary["percentiles"].items()),
+        f"  趋势: 每次测试 {summary['trend_slope']:+}，每 100 次 {summary['trend_slope'] * 100:+.2f}",
+    ]
+    if summary["daily"] and days > 0:
+        lines.append(f"  最近 {days} 天:")
+        for row in summary["daily"][-days:]:
+            lines.append(f"    {row['day']}  次数: {row['count']}  平均: {row['mean']}  最高: {row['max']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):#命令行报告：python analytics.py [数据文件] [--storage sqlite] [--json]
+    parser = argparse.ArgumentParser(description="TypeFlow 历史记录统计报告")
+    parser.add_argument("data_file", nargs="?", default="typing_data.json", help="数据文件（与 DataManager 相同）")
+    parser.add_argument("--storage", default="sqlite", choices=("json", "log", "sqlite"), help="存储模式")
+    parser.add_argument("--metric", action="append", choices=ANALYTICS_METRICS, help="统计字段，可重复指定")
+    parser.add_argument("--window", type=int, default=10, help="滚动平均的测试次数")
+    parser.add_argument("--days", type=int, default=7, help="显示最近几天的统计")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args(argv)
+    metrics = tuple(args.metric or ANALYTICS_METRICS)
+
+    # DataManager 的加载信息输出到 stderr，保证 --json 的输出可以直接被解析
+    with contextlib.redirect_stdout(sys.stderr):
+        data_manager = DataManager(args.data_file, storage=args.storage)
+        try:
+            history = HistoryColumns.from_data_manager(data_manager, metrics)
+        finally:
+            data_manager.close()
+
+    summaries = [summarize(history, metric, args.window) for metric in metrics]
+    if args.json:
+        print(json.dumps(summaries, ensure_ascii=False, indent=2))
+    else:
+        print("\n\n".join(format_report(summary, args.days) for summary in summaries))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
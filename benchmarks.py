@@ -0,0 +1,287 @@
+# benchmarks.py
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import utils
+from data_manager import DataManager
+from speed_window import RollingSpeedWindow
+from typewriter import TypeWriter
+
+# 生成测试文件用的文本片段
+TEXT_KINDS = {
+    "ascii": "The quick brown fox jumps over the lazy dog. Pack my box with five dozen liquor jugs.\n",
+    "cjk": "天地玄黄，宇宙洪荒。日月盈昃，辰宿列张。寒来暑往，秋收冬藏。闰余成岁，律吕调阳。\n",
+    "mixed": "TypeFlow 打字练习 mixed 中英文 text，包含 numbers 12345 和标点。\n",
+}
+
+BENCHMARK_GROUPS = ("read", "encoding", "save", "dashboard", "rolling")
+
+# 完整运行与快速运行（--quick）的参数
+FULL_SETTINGS = {
+    "sizes_mb": (1, 16, 128),
+    "char_limit": 1_000_000,         # 逐字符读取时最多读取的字符数
+    "history_sizes": (0, 1000, 10000),
+    "save_repeat": 20,
+    "session_lengths": (1000, 10000, 100000),
+}
+QUICK_SETTINGS = {
+    "sizes_mb": (1,),
+    "char_limit": 100_000,
+    "history_sizes": (0, 1000),
+    "save_repeat": 5,
+    "session_lengths": (1000, 10000),
+}
+
+
+def _result(name, params, value, unit, higher_is_better):
+    return {"name": name, "params": params, "value": round(value, 4), "unit": unit,
+            "higher_is_better": higher_is_better}
+
+
+def result_key(result):#结果的唯一标识：名称 + 参数，用于和基线对比
+    params = ",".join(f"{key}={result['params'][key]}" for key in sorted(result["params"]))
+    return f"{result['name']}[{params}]"
+
+
+def _median_seconds(func, repeat):#重复执行func，返回耗时的中位数（秒）
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def make_text_file(path, size_mb, kind):#生成约size_mb MB的测试文件，返回实际字节数
+    line = TEXT_KINDS[kind]
+    block = (line * max(1, 65536 // len(line.encode("utf-8")))).encode("utf-8")
+    target = int(size_mb * 1024 * 1024)
+    written = 0
+    with open(path, "wb") as f:
+        while written < target:
+            f.write(block)
+            written += len(block)
+    return written
+
+
+def benchmark_read(work_dir, sizes_mb, char_limit):
+    # 读取吞吐：整块读取（iter_chunks）的 MB/s，以及逐字符读取（get_next_char）的百万字符/秒
+    results = []
+    for size_mb in sizes_mb:
+        for kind in TEXT_KINDS:
+            path = os.path.join(work_dir, f"read_{kind}_{size_mb}mb.txt")
+            size_bytes = make_text_file(path, size_mb, kind)
+            for use_mmap in (False, True):
+                params = {"size_mb": size_mb, "kind": kind, "mmap": use_mmap}
+                typewriter = TypeWriter()
+
+                typewriter.open_file(path, "utf-8", use_mmap=use_mmap)
+                start = time.perf_counter()
+                for _ in typewriter.iter_chunks():
+                    pass
+                elapsed = time.perf_counter() - start
+                results.append(_result("read_chunks", params, size_bytes / 1e6 / elapsed, "MB/s", True))
+
+                typewriter.open_file(path, "utf-8", use_mmap=use_mmap)
+                get_next_char = typewriter.get_next_char
+                count = 0
+                start = time.perf_counter()
+                while count < char_limit and get_next_char() is not None:
+                    count += 1
+                elapsed = time.perf_counter() - start
+                results.append(_result("read_chars", params, count / 1e6 / elapsed, "Mchar/s", True))
+                typewriter.reset()
+            os.remove(path)
+    return results
+
+
+def benchmark_encoding(work_dir, sizes_mb):
+    # 编码检测耗时（清空缓存后的首次检测）
+    results = []
+    for size_mb in sizes_mb:
+        for kind in TEXT_KINDS:
+            path = os.path.join(work_dir, f"encoding_{kind}_{size_mb}mb.txt")
+            make_text_file(path, size_mb, kind)
+
+            def detect():
+                utils._encoding_cache.clear()
+                utils.detect_encoding_with_confidence(path)
+
+            seconds = _median_seconds(detect, 3)
+            results.append(_result("detect_encoding", {"size_mb": size_mb, "kind": kind}, seconds * 1000, "ms", False))
+            os.remove(path)
+    return results
+
+
+def _history_record(i):
+    return {
+        "timestamp": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d} 12:00:00",
+        "speed": 100 + i % 200, "duration": 60.0, "typed_chars": 300 + i % 50,
+        "total_keystrokes": 320 + i % 50, "wpm_estimated": 40 + i % 60, "file_name": f"file{i % 7}.txt",
+    }
+
+
+def _prepared_data_manager(work_dir, storage, history_size):#创建带history_size条历史记录的DataManager
+    data_dir = tempfile.mkdtemp(dir=work_dir)
+    data_manager = DataManager(os.path.join(data_dir, "bench_data.json"), storage=storage)
+    if history_size:
+        data_manager.store.append_many([_history_record(i) for i in range(history_size)])
+    return data_manager, data_dir
+
+
+def benchmark_save(work_dir, history_sizes, repeat):
+    # save_test 的延迟与历史记录条数的关系（同步写入）
+    results = []
+    for storage in ("json", "log", "sqlite"):
+        for history_size in history_sizes:
+            data_manager, data_dir = _prepared_data_manager(work_dir, storage, history_size)
+            counter = iter(range(history_size, history_size + repeat))
+            seconds = _median_seconds(lambda: data_manager.save_test(_history_record(next(counter))), repeat)
+            data_manager.close()
+            shutil.rmtree(data_dir, ignore_errors=True)
+            results.append(_result("save_test", {"storage": storage, "history": history_size},
+                                   seconds * 1e6, "us", False))
+    return results
+
+
+def benchmark_dashboard(work_dir, history_sizes):
+    # 打开数据面板所需的查询：总条数、第一页记录、按天趋势；另外单独测量最新一页（历史表格第一页）
+    results = []
+    for storage in ("json", "log", "sqlite"):
+        for history_size in history_sizes:
+            data_manager, data_dir = _prepared_data_manager(work_dir, storage, history_size)
+
+            def load_dashboard():
+                data_manager.get_total_test_count()
+                data_manager.get_tests_page(0, 100)
+                data_manager.get_trend("wpm_estimated", bucket="day")
+
+            seconds = _median_seconds(load_dashboard, 3)
+            page_seconds = _median_seconds(lambda: data_manager.get_tests_page(0, 100), 3)
+            data_manager.close()
+            shutil.rmtree(data_dir, ignore_errors=True)
+            results.append(_result("dashboard_load", {"storage": storage, "history": history_size},
+                                   seconds * 1000, "ms", False))
+            results.append(_result("newest_page", {"storage": storage, "history": history_size},
+                                   page_seconds * 1000, "ms", False))
+    return results
+
+
+def benchmark_rolling(session_lengths):
+    # 滚动速度：每次按键记录一次并查询全部窗口速度，单次按键的平均耗时（取 3 次中最快的一次）
+    results = []
+    for length in session_lengths:
+        best = None
+        for _ in range(3):
+            window = RollingSpeedWindow()
+            window.reset(0.0)
+            start = time.perf_counter()
+            for i in range(length):
+                now = i * 0.1
+                window.add(now)
+                window.speeds(now)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append(_result("rolling_speed", {"keys": length}, best / length * 1e6, "us/key", False))
+    return results
+
+
+def run_benchmarks(groups=BENCHMARK_GROUPS, quick=False, sizes_mb=None, work_dir=None):#运行指定的基准测试组，返回结果文档
+    settings = dict(QUICK_SETTINGS if quick else FULL_SETTINGS)
+    if sizes_mb:
+        settings["sizes_mb"] = tuple(sizes_mb)
+
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="typeflow_bench_")
+    results = []
+    try:
+        if "read" in groups:
+            results += benchmark_read(work_dir, settings["sizes_mb"], settings["char_limit"])
+        if "encoding" in groups:
+            results += benchmark_encoding(work_dir, settings["sizes_mb"])
+        if "save" in groups:
+            results += benchmark_save(work_dir, settings["history_sizes"], settings["save_repeat"])
+        if "dashboard" in groups:
+            results += benchmark_dashboard(work_dir, settings["history_sizes"])
+        if "rolling" in groups:
+            results += benchmark_rolling(settings["session_lengths"])
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare_results(current, baseline, threshold=0.2):
+    # 与基线对比：返回 [(标识, 基线值, 当前值, 变化比例, 是否退化)]，变化比例 > 0 表示变好
+    # 只比较两边都有的结果；变差超过 threshold 视为退化
+    baseline_values = {result_key(r): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        key = result_key(result)
+        base = baseline_values.get(key)
+        if base is None or not base["value"]:
+            continue
+        change = (result["value"] - base["value"]) / base["value"]
+        if not result["higher_is_better"]:
+            change = -change
+        rows.append((key, base["value"], result["value"], change, change < -threshold))
+    return rows
+
+
+def main(argv=None):#命令行：python -m benchmarks [--quick] [--output 结果.json] [--baseline 基线.json]
+    parser = argparse.ArgumentParser(description="TypeFlow 性能基准测试")
+    parser.add_argument("--quick", action="store_true", help="使用较小的数据量快速运行")
+    parser.add_argument("--only", action="append", choices=BENCHMARK_GROUPS, help="只运行指定的测试组，可重复指定")
+    parser.add_argument("--sizes", help="读取/编码检测的文件大小（MB），逗号分隔，例如 1,64,1024")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之对比的基线结果 JSON 文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定为退化的变差比例（默认 0.2）")
+    args = parser.parse_args(argv)
+
+    sizes_mb = [float(size) if "." in size else int(size) for size in args.sizes.split(",")] if args.sizes else None
+    # DataManager 的提示信息输出到 stderr，保证标准输出只有 JSON 结果
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_benchmarks(tuple(args.only or BENCHMARK_GROUPS), args.quick, sizes_mb)
+
+    for result in report["results"]:
+        print(f"{result_key(result):60s} {result['value']:>14.4f} {result['unit']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare_results(report, baseline, args.threshold)
+        regressions = [row for row in rows if row[4]]
+        for key, base_value, value, change, regressed in rows:
+            mark = "退化" if regressed else ""
+            print(f"{key:60s} {base_value:>12.4f} -> {value:>12.4f} {change:+7.1%} {mark}", file=sys.stderr)
+        if regressions:
+            print(f"{len(regressions)} 项结果比基线差 {args.threshold:.0%} 以上", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# corpus_cache.py
+import codecs
+import hashlib
+import io
+import json
+import mmap
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+from history_store import _atomic_write
+from segment_index import SegmentIndex
+
+CACHE_ENCODING = "utf-32-le"   # 每个字符固定 4 字节，字符位置 * 4 即字节位置
+CHAR_SIZE = 4
+READ_BLOCK = 1 << 20           # 构建缓存时每次读取的字节数
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".typeflow", "cache")
+
+
+class CachedTextReader:
+    # 读取缓存中的预解码文本：mmap 后按 字符位置 * 4 直接切片，不需要增量解码或索引
+    # 接口与 MappedTextReader 相同（read/seek/tell/read_range/close），可直接交给 TypeWriter
+    # line_offsets / word_offsets 为每行、每个词第一个字符的位置（memoryview，格式 'q'），
+    # 词与逐词显示的分段（segment_index）相同，TypeWriter 逐行、逐词显示时直接查这两个表
+
+    supports_char_seek = True
+
+    def __init__(self, text_path, lines_path, words_path):
+        self.files = []
+        self.maps = []
+        self.text_map = self._map(text_path)
+        self.total_chars = len(self.text_map) // CHAR_SIZE if self.text_map is not None else 0
+        self.line_offsets = self._offsets(lines_path)
+        self.word_offsets = self._offsets(words_path)
+        self.char_pos = 0
+
+    def _map(self, path):#只读映射一个文件，空文件返回 None
+        file = open(path, "rb")
+        self.files.append(file)
+        if os.fstat(file.fileno()).st_size == 0:
+            return None
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mapped)
+        return mapped
+
+    def _offsets(self, path):
+        mapped = self._map(path)
+        if mapped is None:
+            return memoryview(array("q"))
+        return memoryview(mapped).cast("q")
+
+    def read(self, size=-1):#读取最多size个字符，末尾返回空字符串
+        start = self.char_pos
+        end = self.total_chars if size < 0 else min(self.total_chars, start + size)
+        if end <= start:
+            return ""
+        self.char_pos = end
+        return str(self.text_map[start * CHAR_SIZE:end * CHAR_SIZE], CACHE_ENCODING)
+
+    def seek(self, char_index):#跳到第char_index个字符，返回实际位置
+        self.char_pos = min(max(0, char_index), self.total_chars)
+        return self.char_pos
+
+    def tell(self):
+        return self.char_pos
+
+    def read_range(self, start, end):#读取[start, end)范围的字符，不改变当前读取位置
+        start = max(0, start)
+        end = min(end, self.total_chars)
+        if end <= start:
+            return ""
+        return str(self.text_map[start * CHAR_SIZE:end * CHAR_SIZE], CACHE_ENCODING)
+
+    def line_of(self, char_index):#字符所在的行号（从 0 开始）
+        return max(0, bisect_right(self.line_offsets, char_index) - 1)
+
+    def word_of(self, char_index):#字符所在的词序号（从 0 开始）
+        return bisect_right(self.word_offsets, char_index) - 1
+
+    def close(self):
+        # 先释放 memoryview，否则 mmap 无法关闭
+        for view in (self.line_offsets, self.word_offsets):
+            view.release()
+        for mapped in self.maps:
+            mapped.close()
+        for file in self.files:
+            file.close()
+        self.maps = []
+        self.files = []
+        self.text_map = None
+
+
+class CorpusCache:
+    # 练习文本缓存：每个文件只解码一次，以 UTF-32 保存（换行统一为 \n），同时保存行首、词首偏移表
+    # 以内容的 SHA-256 为键（内容相同的不同路径共用一份）；路径 + 大小 + 修改时间命中时不重新计算哈希
+    # 总大小超过 budget_bytes 时按最近使用时间淘汰；预计单个条目就超过预算的文件不缓存
+    # open() 只打开已有的缓存，不会解码文件；缓存由 build()（通常在后台线程，见 build_in_background）生成
+    # 命中时只在内存中更新最近使用时间，清单在构建、淘汰和 close() 时才写盘
+    # 目录结构：manifest.json，<哈希>.u32（文本），<哈希>.lines，<哈希>.words（array('q')）
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, budget_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.entries = {}   # 哈希 -> {"encoding", "chars", "bytes", "last_used"}
+        self.paths = {}     # 绝对路径 -> {"size", "mtime_ns", "hash"}
+        self.lock = threading.RLock()   # 只保护 entries / paths 和清单文件，解码文件时不持有
+        self.building = set()           # 正在后台构建的路径
+        self.oversized = set()          # 超过预算而不缓存的 (路径, 大小, 修改时间)
+        self.dirty = False              # 内存中的最近使用时间是否尚未写入清单
+        self._load_manifest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.entries = manifest.get("entries", {})
+            self.paths = manifest.get("paths", {})
+        except (OSError, ValueError) as error:
+            print(f"读取缓存清单时出错，将重建缓存: {error}")
+            self.entries = {}
+            self.paths = {}
+        # 丢掉文件已经不存在的条目
+        for digest in [d for d in self.entries if not os.path.exists(self._file(d, "u32"))]:
+            del self.entries[digest]
+        self.paths = {path: info for path, info in self.paths.items() if info["hash"] in self.entries}
+
+    def _save_manifest(self):
+        self.dirty = False
+        manifest = {"entries": self.entries, "paths": self.paths}
+        _atomic_write(self.manifest_path, lambda f: json.dump(manifest, f, ensure_ascii=False))
+
+    def _file(self, digest, kind):
+        return os.path.join(self.cache_dir, f"{digest}.{kind}")
+
+    def lookup(self, file_path):#文件未变化且已缓存时返回条目（含编码），否则返回 None；不读取文件内容
+        path = os.path.abspath(file_path)
+        with self.lock:
+            info = self.paths.get(path)
+        if info is None:
+            return None
+        stat = os.stat(path)
+        if info["size"] != stat.st_size or info["mtime_ns"] != stat.st_mtime_ns:
+            return None
+        with self.lock:
+            return self.entries.get(info["hash"])
+
+    def open(self, file_path, encoding):#已缓存时返回 CachedTextReader，否则返回 None（不读取、不解码原文件）
+        path = os.path.abspath(file_path)
+        entry = self.lookup(path)
+        if entry is None or entry["encoding"] != encoding:
+            return None
+        with self.lock:
+            info = self.paths.get(path)
+            if info is None or self.entries.get(info["hash"]) is not entry:
+                return None     # 刚刚被重建或淘汰
+            digest = info["hash"]
+            entry["last_used"] = time.time()
+            self.dirty = True
+        return CachedTextReader(self._file(digest, "u32"), self._file(digest, "lines"), self._file(digest, "words"))
+
+    def build(self, file_path, encoding):#解码文件生成缓存，返回是否已缓存（超过预算时不缓存，返回 False）
+        path = os.path.abspath(file_path)
+        if self.lookup(path) is not None:
+            return True
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            # 每个字符 4 字节，字符数不超过字节数：按 字节数 * 4 估计
+            if key in self.oversized or stat.st_size * CHAR_SIZE > self.budget_bytes:
+                self.oversized.add(key)
+                return False
+        if self._build(path, encoding, stat) is None:
+            with self.lock:
+                self.oversized.add(key)
+            return False
+        return True
+
+    def build_in_background(self, file_path, encoding):#在后台线程构建缓存（同一文件同时只构建一次），返回线程或 None
+        path = os.path.abspath(file_path)
+        with self.lock:
+            if path in self.building:
+                return None
+            self.building.add(path)
+        thread = threading.Thread(target=self._build_worker, args=(path, encoding), daemon=True)
+        thread.start()
+        return thread
+
+    def _build_worker(self, path, encoding):
+        try:
+            self.build(path, encoding)
+        except (OSError, ValueError, LookupError) as error:
+            print(f"构建文本缓存时出错: {error}")
+        finally:
+            with self.lock:
+                self.building.discard(path)
+
+    def _build(self, path, encoding, stat):#解码一遍文件，同时计算内容哈希并生成偏移表，返回哈希；结果超过预算时返回 None
+        # 解码写入各线程独立的临时文件，不持有锁；只有登记条目、淘汰和保存清单时持有锁
+        temp_name = f"building-{os.getpid()}-{threading.get_ident()}"
+        temp_paths = {kind: self._file(temp_name, kind) for kind in ("u32", "lines", "words")}
+        try:
+            digest, chars = self._decode(path, encoding, temp_paths)
+        except BaseException:
+            # 解码失败（或被中断）时删除未完成的临时文件
+            self._remove_files(temp_paths.values())
+            raise
+
+        size = sum(os.path.getsize(temp_path) for temp_path in temp_paths.values())
+        if size > self.budget_bytes:
+            self._remove_files(temp_paths.values())
+            return None
+        with self.lock:
+            if digest in self.entries:
+                # 内容相同的文件已经缓存过
+                self._remove_files(temp_paths.values())
+            else:
+                for kind, temp_path in temp_paths.items():
+                    os.replace(temp_path, self._file(digest, kind))
+                self.entries[digest] = {"encoding": encoding, "chars": chars, "bytes": size, "last_used": time.time()}
+            self.paths[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest}
+            self._evict(keep=digest)
+            self._save_manifest()
+        return digest
+
+    def _remove_files(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _decode(self, path, encoding, temp_paths):#把文件解码写入临时文件，返回 (内容哈希, 字符数)
+        hasher = hashlib.sha256()
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), True)
+        chars = 0
+        segments = SegmentIndex()   # 词首与逐词显示的分段一致
+        segments.track("word", 0)
+
+        with open(path, "rb") as source, \
+                open(temp_paths["u32"], "wb") as text_file, \
+                open(temp_paths["lines"], "wb") as lines_file, \
+                open(temp_paths["words"], "wb") as words_file:
+            lines = array("q", [0])
+            while True:
+                data = source.read(READ_BLOCK)
+                hasher.update(data)
+                text = decoder.decode(data, final=not data)
+                if text:
+                    text_file.write(text.encode(CACHE_ENCODING))
+                    position = text.find("\n")
+                    while position >= 0:
+                        lines.append(chars + position + 1)
+                        position = text.find("\n", position + 1)
+                    # 最后一个词可能延续到下一块，留到下一块再写出
+                    segments.feed(chars, text)
+                    segments.pop_settled("word").tofile(words_file)
+                    chars += len(text)
+                if len(lines) >= 65536:
+                    # 最后一个行首留在内存中，结束时可能需要去掉
+                    lines[:-1].tofile(lines_file)
+                    lines = lines[-1:]
+                if not data:
+                    break
+            # 文件以换行结尾时，最后一个行首等于总字符数，不是真正的一行
+            if lines[-1] == chars and chars:
+                lines.pop()
+            lines.tofile(lines_file)
+            segments.boundaries("word").tofile(words_file)
+
+        return hasher.hexdigest(), chars
+
+    def _evict(self, keep=None):#超过磁盘预算时删除最久未使用的条目（keep 除外）
+        total = sum(entry["bytes"] for entry in self.entries.values())
+        for digest in sorted(self.entries, key=lambda d: self.entries[d]["last_used"]):
+            if total <= self.budget_bytes:
+                break
+            if digest == keep:
+                continue
+            total -= self.entries.pop(digest)["bytes"]
+            self._remove_files(self._file(digest, kind) for kind in ("u32", "lines", "words"))
+        self.paths = {path: info for path, info in self.paths.items() if info["hash"] in self.entries}
+
+    def close(self):#把内存中更新的最近使用时间写入清单
+        with self.lock:
+            if self.dirty:
+                self._save_manifest()
+
+    def total_bytes(self):
+        return sum(entry["bytes"] for entry in self.entries.values())
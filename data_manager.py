@@ -1,75 +1,166 @@
-import json
 import os
-from datetime import datetime
+import threading
+from history_store import JsonArrayStore, JsonLogStore, SqliteStore
+from write_behind import WriteBehindWriter
+from instrumentation import tracer
 
 class DataManager:
 
-    def __init__(self, data_file_name="typing_data.json"):# 初始化数据管理器
+    def __init__(self, data_file_name="typing_data.json", storage="log",
+                 write_behind=False, flush_interval=0.5, batch_size=64, background_load=False):# 初始化数据管理器
 
         # 保存数据的文件路径
         self.data_file_path = data_file_name
-        
-        # 存储所有历史测试数据的列表
-        self.all_test_data = []
-        
+
+        # 存储模式："json" 为旧的整文件 JSON 数组，"log" 为追加写入的 JSON Lines 日志（带偏移索引，启动时不读全部历史），
+        # "sqlite" 为 SQLite 数据库（按时间建索引，统计在 SQL 中完成）
+        self.storage = storage
+        self.store = self._create_store(storage)
+        self.store_lock = threading.Lock()  # 后台写入线程和界面线程共用存储后端
+
         # 程序启动时自动加载历史数据
-        self.load_data()
-    
-    def load_data(self):#从文件加载历史数据
+        # background_load=True 时在后台线程加载，加载期间持有 store_lock，其他读写操作自动等待加载完成
+        self.loaded = threading.Event()
+        if background_load:
+            self.store_lock.acquire()
+            threading.Thread(target=self._load_in_background, daemon=True).start()
+        else:
+            self.load_data()
+            self.loaded.set()
 
-        # 检查数据文件是否存在
-        if not os.path.exists(self.data_file_path):
-            print("数据文件不存在，创建新的数据文件")
-            return
-        
+        # 后台批量写入：save_test 不再等待磁盘，记录按 flush_interval / batch_size 合并写出
+        self.writer = None
+        if write_behind:
+            self.writer = WriteBehindWriter(self._write_batch, flush_interval, batch_size)
+
+    def _create_store(self, storage):#根据存储模式创建存储后端
+        if storage == "json":
+            return JsonArrayStore(self.data_file_path)
+
+        base_name, extension = os.path.splitext(self.data_file_path)
+        if storage == "log":
+            if extension == ".jsonl":
+                return JsonLogStore(self.data_file_path)
+            # typing_data.json -> typing_data.jsonl，旧的 JSON 数组文件会被自动导入
+            return JsonLogStore(base_name + ".jsonl", legacy_path=self.data_file_path)
+
+        if storage == "sqlite":
+            if extension == ".db":
+                return SqliteStore(self.data_file_path)
+            # typing_data.json -> typing_data.db，第一次创建时优先迁移较新的 .jsonl 日志，其次是 JSON 数组
+            return SqliteStore(base_name + ".db", legacy_paths=(base_name + ".jsonl", self.data_file_path))
+
+        raise ValueError(f"未知的存储模式: {storage}")
+
+    def _load_in_background(self):
+        try:
+            self.load_data()
+        finally:
+            self.loaded.set()
+            self.store_lock.release()
+
+    def wait_loaded(self, timeout=None):#等待历史数据加载完成，返回是否已完成
+        return self.loaded.wait(timeout)
+
+    def load_data(self):#从文件加载历史数据
         try:
-            # 打开文件并读取数据
-            with open(self.data_file_path, 'r', encoding='utf-8') as file:
-                loaded_data = json.load(file)
-                self.all_test_data = loaded_data
-                print(f"成功加载 {len(self.all_test_data)} 条历史记录")
-                
+            self.store.load()
         except Exception as error:
             print(f"加载数据时出错: {error}")
-            self.all_test_data = []
-    
+
     def save_test(self, test_data):#保存一次测试的结果
-        # 将新数据添加到历史数据中
-        self.all_test_data.append(test_data)
-        
-        # 保存到文件
+        if self.writer is not None:
+            # 交给后台线程写盘，立即返回
+            self.writer.submit(test_data)
+            return
+
         try:
-            with open(self.data_file_path, 'w', encoding='utf-8') as file:
-                json.dump(self.all_test_data, file, ensure_ascii=False, indent=2)
+            with tracer.span("save_test"), self.store_lock:
+                self.store.append(test_data)
             print("测试结果保存成功")
-            
+
         except Exception as error:
             print(f"保存数据时出错: {error}")
-    
+
+    def _write_batch(self, records):#后台线程写入一批记录并 fsync
+        with tracer.span("write_batch"), self.store_lock:
+            self.store.append_many(records)
+            self.store.sync()
+        print(f"{len(records)} 条测试结果保存成功")
+
+    def flush(self, timeout=None):#写出所有待保存的记录，返回是否已全部写盘
+        if self.writer is None:
+            return True
+        return self.writer.flush(timeout)
+
+    def wait_durable(self, timeout=None):#等待目前已提交的记录写盘，不主动提前写出
+        if self.writer is None:
+            return True
+        return self.writer.wait_durable(timeout=timeout)
+
+    def compact(self):#压缩日志文件（仅 log 模式有效）
+        self.flush()
+        if hasattr(self.store, "compact"):
+            with self.store_lock:
+                self.store.compact()
+
     def get_recent_tests(self, count=5):# 获取最近的测试记录
 
-        # 如果历史数据为空，返回空列表
-        if not self.all_test_data:
-            return []
-        
         # 获取最后count条记录，并反转顺序（最新的在前面）
-        recent_tests = list(reversed(self.all_test_data[-count:]))
+        self.flush()
+        with self.store_lock:
+            recent_tests = list(reversed(self.store.tail(count)))
         return recent_tests
-    
-    def clear_all_data(self):#清除所有历史数据
 
-        # 清空内存中的数据
-        self.all_test_data = []
-        
-        # 清空文件中的数据
+    def get_tests_page(self, page=0, page_size=20):# 分页获取测试记录（第0页为最新的一页）
+        self.flush()
+        with self.store_lock:
+            total = self.store.count()
+            end = total - page * page_size
+            start = max(0, end - page_size)
+            if end <= 0:
+                return []
+            return list(reversed(self.store.page(start, end - start)))
+
+    def get_tests_sorted_page(self, sort_by, descending=True, page=0, page_size=20):
+        # 按 speed / duration / wpm_estimated 排序后分页获取（SQLite 沿索引读取，其他模式在 Python 中取前若干条）
+        self.flush()
+        with self.store_lock:
+            return self.store.sorted_page(sort_by, descending, page * page_size, page_size)
+
+    def get_columns(self, fields=("timestamp", "wpm_estimated", "speed")):
+        # 按列读取全部历史（保存顺序）：{字段: [值, ...]}，供 analytics 模块做批量统计
+        self.flush()
+        with self.store_lock:
+            return self.store.columns(fields)
+
+    def get_trend(self, metric="wpm_estimated", bucket="day", start=None, end=None, percentile=0.9):
+        # 按天("day")/周("week")/月("month")/文件("file")分组统计 metric 的平均值、中位数、百分位数和最大值
+        # start/end 为 "YYYY-MM-DD HH:MM:SS" 格式的时间字符串，区间为 [start, end)
+        self.flush()
+        with self.store_lock:
+            return self.store.aggregate(metric, bucket, start, end, percentile)
+
+    def clear_all_data(self):#清除所有历史数据
+        # 先写出队列中的记录，避免清除后又被后台线程写回
+        self.flush()
         try:
-            with open(self.data_file_path, 'w', encoding='utf-8') as file:
-                json.dump([], file)
+            with self.store_lock:
+                self.store.clear()
             print("历史数据清除成功")
-            
+
         except Exception as error:
             print(f"清除数据时出错: {error}")
-    
+
     def get_total_test_count(self):#获取总测试次数
 
-        return len(self.all_test_data)
+        self.flush()
+        with self.store_lock:
+            return self.store.count()
+
+    def close(self):#写出剩余记录并关闭数据文件
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        with self.store_lock:
+            self.store.close()
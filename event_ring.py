@@ -0,0 +1,75 @@
+# event_ring.py
+
+# 打包后的按键事件：高位为 perf_counter_ns 时间戳，低 21 位为字符码点（非字符键为 0）
+KEY_CODE_BITS = 21
+KEY_CODE_MASK = (1 << KEY_CODE_BITS) - 1
+
+
+def pack_event(timestamp_ns, key_code=0):
+    return (timestamp_ns << KEY_CODE_BITS) | key_code
+
+
+def unpack_event(event):#返回 (timestamp_ns, key_code)
+    return event >> KEY_CODE_BITS, event & KEY_CODE_MASK
+
+
+def key_code_of(key):#pynput 按键对象 -> 字符码点，功能键和未知按键为 0
+    char = getattr(key, "char", None)
+    if char and len(char) == 1:
+        return ord(char)
+    return 0
+
+
+class SpscRing:
+    # 单生产者单消费者的有界环形队列：生产者（pynput 监听线程）只写 head，消费者只写 tail
+    # 两边都不加锁；在 CPython 中整数下标的赋值是原子的，因此无需同步
+    # 队列满时新事件被丢弃并计数，生产者永远不会阻塞
+
+    def __init__(self, capacity=4096):
+        # 容量取 2 的幂，用位与代替取模
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self.mask = size - 1
+        self.slots = [0] * size
+        self.head = 0           # 下一个写入位置（只由生产者修改）
+        self.tail = 0           # 下一个读取位置（只由消费者修改）
+        self.dropped = 0        # 因队列满丢弃的事件数
+        self.high_water = 0     # 队列中同时积压的最大事件数
+
+    def push(self, event):#生产者：放入一个事件，队列满时返回 False
+        backlog = self.head - self.tail
+        if backlog >= self.capacity:
+            self.dropped += 1
+            return False
+        self.slots[self.head & self.mask] = event
+        self.head += 1
+        if backlog >= self.high_water:
+            self.high_water = backlog + 1
+        return True
+
+    def drain(self):#消费者：取出目前所有事件（按写入顺序）
+        head = self.head
+        tail = self.tail
+        if head == tail:
+            return []
+
+        start = tail & self.mask
+        end = head & self.mask
+        if start < end:
+            events = self.slots[start:end]
+        else:
+            # 跨越数组末尾
+            events = self.slots[start:] + self.slots[:end]
+        self.tail = head
+        return events
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def reset(self):#清空队列和计数（仅在没有生产者写入时调用）
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.high_water = 0
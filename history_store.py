@@ -0,0 +1,636 @@
+# history_store.py
+import heapq
+import json
+import math
+import os
+import sqlite3
+import struct
+from datetime import datetime
+
+# 索引文件中每条记录的偏移量：8 字节小端无符号整数
+INDEX_ENTRY = struct.Struct("<Q")
+
+
+def _atomic_write(file_path, write_func, binary=False):#原子写入：先写临时文件再替换，避免写一半时崩溃损坏数据
+    temp_path = file_path + ".tmp"
+    if binary:
+        file = open(temp_path, 'wb')
+    else:
+        file = open(temp_path, 'w', encoding='utf-8')
+    with file:
+        write_func(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+
+
+class JsonArrayStore:
+    # 旧格式：整个历史记录是一个 JSON 数组，每次保存都重写整个文件
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.records = []
+
+    def load(self):#从文件加载全部历史数据
+        if not os.path.exists(self.file_path):
+            print("数据文件不存在，创建新的数据文件")
+            return
+
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                self.records = json.load(file)
+                print(f"成功加载 {len(self.records)} 条历史记录")
+
+        except Exception as error:
+            print(f"加载数据时出错: {error}")
+            self.records = []
+
+    def append(self, record):#追加一条记录（需要重写整个文件）
+        self.append_many([record])
+
+    def append_many(self, records):#追加多条记录，只重写一次文件
+        self.records.extend(records)
+        with open(self.file_path, 'w', encoding='utf-8') as file:
+            json.dump(self.records, file, ensure_ascii=False, indent=2)
+
+    def sync(self):#每次写入都已关闭文件，这里把数据刷到磁盘
+        if os.path.exists(self.file_path):
+            with open(self.file_path, 'rb+') as file:
+                os.fsync(file.fileno())
+
+    def tail(self, count):#最后count条记录（旧的在前）
+        if count <= 0:
+            return []
+        return self.records[-count:]
+
+    def page(self, start, count):#从第start条开始的count条记录（旧的在前）
+        return self.records[start:start + count]
+
+    def iter_records(self):
+        return iter(list(self.records))
+
+    def columns(self, fields):
+        return record_columns(self.records, fields)
+
+    def sorted_page(self, column, descending=True, start=0, count=20):
+        return sort_records_page(self.records, column, descending, start, count)
+
+    def aggregate(self, metric="wpm_estimated", bucket="day", start=None, end=None, percentile=0.9):
+        return aggregate_records(self.iter_records(), metric, bucket, start, end, percentile)
+
+    def count(self):
+        return len(self.records)
+
+    def clear(self):
+        self.records = []
+        with open(self.file_path, 'w', encoding='utf-8') as file:
+            json.dump([], file)
+
+    def close(self):
+        pass
+
+
+class JsonLogStore:
+    # 追加日志格式（JSON Lines）：每条记录一行，保存只需在文件末尾追加一行
+    # 旁边的 .idx 索引文件按顺序保存每条记录在日志中的字节偏移（每条 8 字节），
+    # 因此统计条数、读取最近记录、分页都只需要 seek，不需要把整个历史读进内存
+    # 旧的 JSON 数组文件（legacy_path）会在日志不存在时自动导入
+
+    def __init__(self, log_path, legacy_path=None):
+        self.log_path = log_path
+        self.index_path = log_path + ".idx"
+        self.legacy_path = legacy_path
+        self.record_count = 0
+        self.log_file = None    # 追加模式的日志句柄，第一次保存时打开
+        self.index_file = None  # 追加模式的索引句柄
+
+    def load(self):#检查日志和索引是否一致；只在不一致时扫描日志
+        if not os.path.exists(self.log_path):
+            if self.legacy_path and os.path.exists(self.legacy_path):
+                self._import_legacy()
+            else:
+                print("数据文件不存在，创建新的数据文件")
+            return
+
+        self.record_count = self._check_index()
+        print(f"成功加载 {self.record_count} 条历史记录索引")
+
+    def _check_index(self):#返回有效记录数，必要时修复索引
+        log_size = os.path.getsize(self.log_path)
+        index_size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        count = index_size // INDEX_ENTRY.size
+
+        scan_from = 0
+        if count > 0:
+            last_offset = self._read_offsets(count - 1, 1)[0]
+            if last_offset >= log_size:
+                # 索引指向日志之外，说明索引已失效，整体重建
+                print("索引文件与日志不一致，正在重建索引")
+                count = 0
+            else:
+                with open(self.log_path, 'rb') as file:
+                    file.seek(last_offset)
+                    line = file.readline()
+                if line.endswith(b"\n"):
+                    scan_from = last_offset + len(line)
+                else:
+                    # 最后一条索引记录本身是残行
+                    count -= 1
+                    scan_from = last_offset
+
+        if count * INDEX_ENTRY.size != index_size:
+            with open(self.index_path, 'ab') as file:
+                file.truncate(count * INDEX_ENTRY.size)
+
+        if scan_from < log_size:
+            count += self._scan_log(scan_from)
+        return count
+
+    def _scan_log(self, start_offset):#从start_offset开始扫描日志，把未索引的有效行补进索引
+        new_offsets = []
+        bad_lines = 0
+        with open(self.log_path, 'rb') as file:
+            file.seek(start_offset)
+            offset = start_offset
+            for line in file:
+                if not line.endswith(b"\n"):
+                    # 写到一半时程序崩溃留下的残行，直接截掉
+                    print("发现未写完的记录，已截断")
+                    break
+                if line.strip():
+                    try:
+                        json.loads(line)
+                        new_offsets.append(offset)
+                    except ValueError:
+                        bad_lines += 1
+                offset += len(line)
+
+        if offset < os.path.getsize(self.log_path):
+            with open(self.log_path, 'ab') as file:
+                file.truncate(offset)
+        if bad_lines:
+            print(f"跳过 {bad_lines} 行损坏的记录")
+
+        with open(self.index_path, 'ab') as file:
+            for new_offset in new_offsets:
+                file.write(INDEX_ENTRY.pack(new_offset))
+        return len(new_offsets)
+
+    def _import_legacy(self):#把旧的 JSON 数组文件转换成日志文件
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as file:
+                loaded_data = json.load(file)
+        except Exception as error:
+            print(f"导入旧数据时出错: {error}")
+            return
+
+        if not isinstance(loaded_data, list):
+            print("导入旧数据时出错: 数据格式不是列表")
+            return
+
+        self._rewrite(loaded_data)
+        print(f"已从 {self.legacy_path} 导入 {len(loaded_data)} 条历史记录")
+
+    def _rewrite(self, records):#把records原子地写成新的日志和索引
+        self.close()
+        offsets = []
+
+        def write_log(file):
+            for record in records:
+                offsets.append(file.tell())
+                file.write(_encode_record(record))
+
+        def write_index(file):
+            for offset in offsets:
+                file.write(INDEX_ENTRY.pack(offset))
+
+        _atomic_write(self.log_path, write_log, binary=True)
+        _atomic_write(self.index_path, write_index, binary=True)
+        self.record_count = len(offsets)
+
+    def _read_offsets(self, start, count):#读取第start条开始的count个偏移量
+        with open(self.index_path, 'rb') as file:
+            file.seek(start * INDEX_ENTRY.size)
+            data = file.read(count * INDEX_ENTRY.size)
+        return [entry[0] for entry in INDEX_ENTRY.iter_unpack(data)]
+
+    def append(self, record):#追加一条记录，代价与历史大小无关
+        self.append_many([record])
+
+    def append_many(self, records):#追加多条记录，日志和索引各写一次
+        if self.log_file is None:
+            self.log_file = open(self.log_path, 'ab')
+            self.index_file = open(self.index_path, 'ab')
+
+        offset = self.log_file.seek(0, os.SEEK_END)
+        lines = []
+        offsets = []
+        for record in records:
+            line = _encode_record(record)
+            offsets.append(INDEX_ENTRY.pack(offset))
+            lines.append(line)
+            offset += len(line)
+
+        # 先写日志再写索引：中途崩溃时，下次启动会把漏掉的索引补上
+        self.log_file.write(b"".join(lines))
+        self.log_file.flush()
+        self.index_file.write(b"".join(offsets))
+        self.index_file.flush()
+        self.record_count += len(records)
+
+    def sync(self):#把已写入的日志和索引 fsync 到磁盘
+        if self.log_file is not None:
+            self._flush_writes()
+            os.fsync(self.log_file.fileno())
+            os.fsync(self.index_file.fileno())
+
+    def compact(self):#原子地重写日志，去掉残行和损坏的行
+        self._rewrite(list(self.iter_records()))
+
+    def page(self, start, count):#从第start条开始的count条记录（旧的在前）
+        start = max(0, start)
+        count = min(count, self.record_count - start)
+        if count <= 0:
+            return []
+
+        self._flush_writes()
+        records = []
+        with open(self.log_path, 'rb') as file:
+            for offset in self._read_offsets(start, count):
+                file.seek(offset)
+                records.append(json.loads(file.readline()))
+        return records
+
+    def tail(self, count):
+        if count <= 0:
+            return []
+        return self.page(self.record_count - count, count)
+
+    def iter_records(self):#按顺序逐条读取所有记录，不一次性载入内存
+        if self.record_count == 0:
+            return
+        self._flush_writes()
+        total = self.record_count
+        with open(self.log_path, 'rb') as file:
+            # 分块读取索引，内存占用与历史大小无关
+            for block_start in range(0, total, 4096):
+                for offset in self._read_offsets(block_start, min(4096, total - block_start)):
+                    file.seek(offset)
+                    yield json.loads(file.readline())
+
+    def columns(self, fields):#需要扫描整个日志
+        return record_columns(self.iter_records(), fields)
+
+    def sorted_page(self, column, descending=True, start=0, count=20):#需要扫描整个日志
+        return sort_records_page(self.iter_records(), column, descending, start, count)
+
+    def aggregate(self, metric="wpm_estimated", bucket="day", start=None, end=None, percentile=0.9):
+        return aggregate_records(self.iter_records(), metric, bucket, start, end, percentile)
+
+    def count(self):
+        return self.record_count
+
+    def clear(self):
+        self._rewrite([])
+        # 同时清空旧格式文件，避免日志被删除后旧数据重新导入
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            _atomic_write(self.legacy_path, lambda file: json.dump([], file))
+
+    def _flush_writes(self):
+        if self.log_file is not None:
+            self.log_file.flush()
+            self.index_file.flush()
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.index_file.close()
+            self.log_file = None
+            self.index_file = None
+
+
+def _encode_record(record):#一条记录编码成一行 UTF-8 JSON
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+# 可以参与统计的数值字段
+METRIC_COLUMNS = ("speed", "duration", "typed_chars", "total_keystrokes", "wpm_estimated")
+
+# 分组方式 -> (SQL 表达式, Python 取值函数)
+BUCKETS = {
+    "day": ("date(timestamp)", lambda record: _parse_time(record).strftime("%Y-%m-%d")),
+    "week": ("strftime('%Y-W%W', timestamp)", lambda record: _parse_time(record).strftime("%Y-W%W")),
+    "month": ("strftime('%Y-%m', timestamp)", lambda record: _parse_time(record).strftime("%Y-%m")),
+    "file": ("file_name", lambda record: record.get("file_name")),
+}
+
+
+def _parse_time(record):
+    return datetime.strptime(record["timestamp"][:19], "%Y-%m-%d %H:%M:%S")
+
+
+def _check_aggregate_args(metric, bucket, percentile):
+    if metric not in METRIC_COLUMNS:
+        raise ValueError(f"不支持的统计字段: {metric}")
+    if bucket not in BUCKETS:
+        raise ValueError(f"不支持的分组方式: {bucket}")
+    if not 0 < percentile <= 1:
+        raise ValueError("percentile 必须在 (0, 1] 之间")
+
+
+def aggregate_records(records, metric="wpm_estimated", bucket="day", start=None, end=None, percentile=0.9):
+    # 在 Python 中逐条分组统计，供没有 SQL 的存储后端使用
+    # start/end 为 "YYYY-MM-DD HH:MM:SS" 格式的字符串，区间为 [start, end)
+    _check_aggregate_args(metric, bucket, percentile)
+    bucket_func = BUCKETS[bucket][1]
+
+    groups = {}
+    for record in records:
+        value = record.get(metric)
+        timestamp = record.get("timestamp")
+        if value is None or not timestamp:
+            continue
+        if start is not None and timestamp < start:
+            continue
+        if end is not None and timestamp >= end:
+            continue
+        try:
+            key = bucket_func(record)
+        except ValueError:
+            continue
+        if key is None:
+            continue
+        groups.setdefault(key, []).append(value)
+
+    result = []
+    for key in sorted(groups):
+        values = sorted(groups[key])
+        count = len(values)
+        middle = count // 2
+        if count % 2:
+            median = values[middle]
+        else:
+            median = (values[middle - 1] + values[middle]) / 2
+        # 最近秩法：第 ceil(p * n) 小的值
+        rank = max(1, math.ceil(percentile * count))
+        result.append(_aggregate_row(key, count, sum(values) / count, median, values[rank - 1], values[-1]))
+    return result
+
+
+def _aggregate_row(bucket, count, mean, median, percentile_value, maximum):
+    return {
+        "bucket": bucket,
+        "count": count,
+        "mean": round(mean, 2),
+        "median": round(median, 2),
+        "percentile": round(percentile_value, 2),
+        "max": round(maximum, 2),
+    }
+
+
+def _check_column_fields(fields):
+    for field in fields:
+        if field != "timestamp" and field not in METRIC_COLUMNS:
+            raise ValueError(f"不支持的字段: {field}")
+
+
+def record_columns(records, fields):
+    # 把记录按列拆开：{字段: [值, ...]}，缺失或不是数字的统计字段为 None，供没有 SQL 的存储后端使用
+    _check_column_fields(fields)
+    columns = {field: [] for field in fields}
+    for record in records:
+        for field in fields:
+            value = record.get(field)
+            if field != "timestamp" and not isinstance(value, (int, float)):
+                value = None
+            columns[field].append(value)
+    return columns
+
+
+# 历史记录列表可以按这些字段排序（SQLite 中各自有索引）
+SORT_COLUMNS = ("speed", "duration", "wpm_estimated")
+
+
+def sort_records_page(records, column, descending=True, start=0, count=20):
+    # 在 Python 中取按 column 排序后的第 [start, start + count) 条，供没有 SQL 的存储后端使用
+    # 只保留前 start + count 条（堆），不排序全部历史；缺失的值视为最小，值相同时按保存顺序
+    if column not in SORT_COLUMNS:
+        raise ValueError(f"不支持的排序字段: {column}")
+    if count <= 0:
+        return []
+
+    def key(item):
+        index, record = item
+        value = record.get(column)
+        if not isinstance(value, (int, float)):
+            value = float("-inf")
+        return value, index
+
+    select = heapq.nlargest if descending else heapq.nsmallest
+    top = select(start + count, enumerate(records), key=key)
+    return [record for _, record in top[start:]]
+
+
+class SqliteStore:
+    # SQLite 存储（WAL 模式）：常用字段拆成列并建立索引，完整记录以 JSON 保存在 payload 列
+    # 按天/周/月/文件的统计直接在 SQL 中完成，不需要把历史读进 Python
+    # 数据库第一次创建时会自动导入 legacy_paths 中第一个存在的旧数据文件
+
+    def __init__(self, db_path, legacy_paths=()):
+        self.db_path = db_path
+        self.legacy_paths = legacy_paths
+        self.connection = None
+        self.record_count = 0
+
+    def load(self):#打开数据库，建表建索引，必要时迁移旧数据
+        is_new = not os.path.exists(self.db_path)
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # 每个事务提交时都 fsync；批量写入时一批只提交一次
+        self.connection.execute("PRAGMA synchronous=FULL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS tests ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " timestamp TEXT,"
+                " speed REAL,"
+                " duration REAL,"
+                " typed_chars INTEGER,"
+                " total_keystrokes INTEGER,"
+                " wpm_estimated REAL,"
+                " file_name TEXT,"
+                " payload TEXT NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_tests_timestamp ON tests(timestamp)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_tests_file ON tests(file_name, timestamp)")
+            for column in SORT_COLUMNS:
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS idx_tests_{column} ON tests({column})")
+
+        if is_new:
+            for legacy_path in self.legacy_paths:
+                if os.path.exists(legacy_path):
+                    try:
+                        imported = migrate_to_sqlite(legacy_path, self)
+                        print(f"已从 {legacy_path} 导入 {imported} 条历史记录")
+                    except Exception as error:
+                        print(f"导入旧数据时出错: {error}")
+                    break
+
+        self.record_count = self.connection.execute("SELECT COUNT(*) FROM tests").fetchone()[0]
+        print(f"成功加载 {self.record_count} 条历史记录索引")
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):#在一个事务中插入多条记录
+        rows = [_record_row(record) for record in records]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO tests (timestamp, speed, duration, typed_chars, total_keystrokes,"
+                " wpm_estimated, file_name, payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self.record_count += len(rows)
+
+    def sync(self):#synchronous=FULL 下每次提交都已 fsync
+        pass
+
+    def page(self, start, count):#从第start条开始的count条记录（旧的在前）
+        start = max(0, start)
+        count = min(count, self.record_count - start)
+        if count <= 0:
+            return []
+        from_end = self.record_count - start - count
+        if from_end < start:
+            # 靠近最新一端的页从新到旧沿主键读取，OFFSET 只需跳过更新的记录（第一页为常数时间）
+            cursor = self.connection.execute(
+                "SELECT payload FROM tests ORDER BY id DESC LIMIT ? OFFSET ?", (count, from_end))
+            return [json.loads(row[0]) for row in reversed(cursor.fetchall())]
+        cursor = self.connection.execute(
+            "SELECT payload FROM tests ORDER BY id LIMIT ? OFFSET ?", (count, start))
+        return [json.loads(row[0]) for row in cursor]
+
+    def tail(self, count):
+        if count <= 0:
+            return []
+        cursor = self.connection.execute(
+            "SELECT payload FROM tests ORDER BY id DESC LIMIT ?", (count,))
+        return [json.loads(row[0]) for row in reversed(cursor.fetchall())]
+
+    def sorted_page(self, column, descending=True, start=0, count=20):#按column排序后的第start条开始的count条记录（沿索引读取）
+        if column not in SORT_COLUMNS:
+            raise ValueError(f"不支持的排序字段: {column}")
+        if count <= 0:
+            return []
+        direction = "DESC" if descending else "ASC"
+        cursor = self.connection.execute(
+            f"SELECT payload FROM tests ORDER BY {column} {direction}, id {direction} LIMIT ? OFFSET ?",
+            (count, max(0, start)))
+        return [json.loads(row[0]) for row in cursor]
+
+    def columns(self, fields):#只读取需要的列，不解析 payload
+        _check_column_fields(fields)
+        rows = self.connection.execute(f"SELECT {', '.join(fields)} FROM tests ORDER BY id").fetchall()
+        if not rows:
+            return {field: [] for field in fields}
+        return {field: list(values) for field, values in zip(fields, zip(*rows))}
+
+    def iter_records(self):
+        cursor = self.connection.execute("SELECT payload FROM tests ORDER BY id")
+        for row in cursor:
+            yield json.loads(row[0])
+
+    def aggregate(self, metric="wpm_estimated", bucket="day", start=None, end=None, percentile=0.9):
+        # 用窗口函数在 SQL 中计算每组的平均值、中位数、百分位数和最大值
+        _check_aggregate_args(metric, bucket, percentile)
+        bucket_sql = BUCKETS[bucket][0]
+
+        conditions = [f"{metric} IS NOT NULL", "timestamp IS NOT NULL"]
+        params = []
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp < ?")
+            params.append(end)
+
+        query = (
+            "WITH ranked AS ("
+            f" SELECT {bucket_sql} AS bucket, {metric} AS value,"
+            f" ROW_NUMBER() OVER (PARTITION BY {bucket_sql} ORDER BY {metric}) AS rn,"
+            f" COUNT(*) OVER (PARTITION BY {bucket_sql}) AS n"
+            f" FROM tests WHERE {' AND '.join(conditions)})"
+            " SELECT bucket, n, AVG(value),"
+            " AVG(CASE WHEN rn IN ((n + 1) / 2, (n + 2) / 2) THEN value END),"
+            # 最近秩法：rn = ceil(p * n)
+            " MAX(CASE WHEN rn = MAX(1, CAST(? * n AS INTEGER) + (? * n > CAST(? * n AS INTEGER)))"
+            " THEN value END),"
+            " MAX(value)"
+            " FROM ranked WHERE bucket IS NOT NULL GROUP BY bucket ORDER BY bucket"
+        )
+        cursor = self.connection.execute(query, params + [percentile] * 3)
+        return [_aggregate_row(*row) for row in cursor]
+
+    def count(self):
+        return self.record_count
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM tests")
+        self.record_count = 0
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def _record_row(record):#一条记录 -> tests 表的一行
+    def number(key):
+        value = record.get(key)
+        return value if isinstance(value, (int, float)) else None
+
+    return (
+        record.get("timestamp"),
+        number("speed"),
+        number("duration"),
+        number("typed_chars"),
+        number("total_keystrokes"),
+        number("wpm_estimated"),
+        record.get("file_name"),
+        json.dumps(record, ensure_ascii=False),
+    )
+
+
+def _read_json_records(file_path):#读取旧数据：JSON 数组或 JSON Lines
+    with open(file_path, 'r', encoding='utf-8') as file:
+        if file_path.endswith(".jsonl"):
+            records = []
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+            return records
+        loaded_data = json.load(file)
+    if not isinstance(loaded_data, list):
+        raise ValueError("数据格式不是列表")
+    return loaded_data
+
+
+def migrate_to_sqlite(source_path, target):#把 typing_data.json / .jsonl 迁移到 SQLite，返回导入条数
+    # target 可以是数据库文件路径或已打开的 SqliteStore
+    records = _read_json_records(source_path)
+    if isinstance(target, SqliteStore):
+        target.append_many(records)
+        return len(records)
+
+    store = SqliteStore(target)
+    store.load()
+    try:
+        store.append_many(records)
+    finally:
+        store.close()
+    return len(records)
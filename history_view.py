@@ -0,0 +1,96 @@
+# history_view.py
+import ttkbootstrap as ttk
+
+
+class HistoryTable:
+    # 历史记录表格：ttk.Treeview 按页从 DataManager 读取记录，滚动接近底部时再读下一页，
+    # 打开面板只读取第一页，耗时与历史记录条数无关
+    # 点击可排序的列标题切换排序（再次点击反向），排序由存储后端完成
+
+    COLUMNS = (
+        ("timestamp", "时间", 150),
+        ("speed", "即时速度(字/分)", 110),
+        ("duration", "时长(s)", 80),
+        ("typed_chars", "显示字符", 80),
+        ("total_keystrokes", "按键总数", 80),
+        ("wpm_estimated", "估算 WPM", 90),
+        ("file_name", "文件", 140),
+    )
+    SORTABLE = ("speed", "duration", "wpm_estimated")
+
+    def __init__(self, parent, data_manager, page_size=100):
+        self.data_manager = data_manager
+        self.page_size = page_size
+
+        self.sort_by = None        # None 表示按时间（最新的在前）
+        self.descending = True
+        self.next_page = 0
+        self.exhausted = False     # 已读到最后一页
+        self.loading = False
+
+        self.frame = ttk.Frame(parent)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical")
+        self.tree = ttk.Treeview(self.frame, columns=[key for key, _, _ in self.COLUMNS],
+                                 show="headings", yscrollcommand=self._on_scroll)
+        self.scrollbar.config(command=self.tree.yview)
+
+        for key, heading, width in self.COLUMNS:
+            if key in self.SORTABLE:
+                self.tree.heading(key, text=heading, command=lambda column=key: self.sort(column))
+            else:
+                self.tree.heading(key, text=heading)
+            self.tree.column(key, width=width, anchor="w" if key in ("timestamp", "file_name") else "e")
+
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.load_more()
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def _fetch(self, page):#读取一页记录
+        if self.sort_by is None:
+            return self.data_manager.get_tests_page(page, self.page_size) # 调用data_manager包
+        return self.data_manager.get_tests_sorted_page(self.sort_by, self.descending, page, self.page_size) # 调用data_manager包
+
+    def load_more(self):#读取下一页并追加到表格末尾
+        self.loading = False
+        if self.exhausted:
+            return
+        records = self._fetch(self.next_page)
+        self.next_page += 1
+        if len(records) < self.page_size:
+            self.exhausted = True
+        for rec in records:
+            self.tree.insert("", "end", values=[self._format(rec.get(key)) for key, _, _ in self.COLUMNS])
+
+    def _format(self, value):
+        return "-" if value is None else value
+
+    def _on_scroll(self, first, last):#Treeview 的 yscrollcommand：滚动到接近底部时安排读取下一页
+        self.scrollbar.set(first, last)
+        if float(last) > 0.9 and not self.exhausted and not self.loading:
+            self.loading = True
+            self.tree.after_idle(self.load_more)
+
+    def sort(self, column):#按column排序，重复点击同一列时切换升降序
+        if self.sort_by == column:
+            self.descending = not self.descending
+        else:
+            self.sort_by = column
+            self.descending = True
+
+        for key, heading, _ in self.COLUMNS:
+            if key == column:
+                heading += " ▼" if self.descending else " ▲"
+            self.tree.heading(key, text=heading)
+
+        self.reload()
+
+    def reload(self):#清空表格，从第一页重新读取
+        self.tree.delete(*self.tree.get_children())
+        self.next_page = 0
+        self.exhausted = False
+        self.load_more()
+        self.tree.yview_moveto(0)
@@ -0,0 +1,136 @@
+# instrumentation.py
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from interval_stats import IntervalHistogram
+
+# 热路径上的写法（关闭时只多一次属性读取和比较）：
+#     start = time.perf_counter_ns() if tracer.enabled else 0
+#     ...
+#     if start:
+#         tracer.record("名称", start)
+# 非热路径可以用 with tracer.span("名称"): ...
+
+
+class _NullSpan:
+    # 关闭时 span() 返回的空上下文，不计时
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.start_ns = 0
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.record(self.name, self.start_ns)
+        return False
+
+
+class Tracer:
+    # 可选的性能记录：每个名称一个耗时直方图（100 纳秒为单位，约 13 秒封顶）和计数器，
+    # 同时在有界缓冲区中保留最近 max_events 个事件，用于导出 Chrome trace（chrome://tracing、Perfetto）
+    # 默认关闭；环境变量 TYPEFLOW_TRACE=1 时启动即开启
+
+    def __init__(self, enabled=False, max_events=100000):
+        self.enabled = enabled
+        self.max_events = max_events
+        self.lock = threading.Lock()   # 界面线程、后台写入线程、分析线程都会记录
+        self._clear()
+
+    def _clear(self):
+        self.histograms = {}       # 名称 -> IntervalHistogram
+        self.counters = {}         # 名称 -> 次数
+        self.events = deque(maxlen=self.max_events)   # (名称, 开始 ns, 耗时 ns, 线程号)
+        self.origin_ns = time.perf_counter_ns()
+
+    def reset(self):#清空已记录的数据（不改变开关）
+        with self.lock:
+            self._clear()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name):#计时上下文，关闭时返回不计时的空上下文
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, start_ns, end_ns=None):#记录一段耗时（start_ns/end_ns 为 perf_counter_ns）
+        if end_ns is None:
+            end_ns = time.perf_counter_ns()
+        duration_ns = end_ns - start_ns
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = IntervalHistogram(unit_ns=100)
+            histogram.record(duration_ns)
+            self.events.append((name, start_ns, duration_ns, threading.get_ident()))
+
+    def count(self, name, amount=1):#计数器加一（关闭时不记录）
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):#当前统计：各名称的次数、总耗时、平均和 p50/p95/p99/最大耗时（毫秒），以及计数器
+        with self.lock:
+            spans = {}
+            for name, histogram in self.histograms.items():
+                p = histogram.percentiles((50, 95, 99))
+                spans[name] = {
+                    "count": histogram.count,
+                    "total_ms": round(histogram.total_ns / 1e6, 3),
+                    "mean_ms": round(histogram.total_ns / histogram.count / 1e6, 4),
+                    "p50_ms": round(p[50], 4),
+                    "p95_ms": round(p[95], 4),
+                    "p99_ms": round(p[99], 4),
+                    "max_ms": round(histogram.max_ns / 1e6, 4),
+                }
+            return {"enabled": self.enabled, "spans": spans, "counters": dict(self.counters)}
+
+    def chrome_trace(self):#Chrome trace-event 格式（完整事件 "X"，时间单位为微秒）
+        pid = os.getpid()
+        with self.lock:
+            events = list(self.events)
+            origin_ns = self.origin_ns
+        return {
+            "traceEvents": [
+                {"name": name, "ph": "X", "ts": (start_ns - origin_ns) / 1000, "dur": duration_ns / 1000,
+                 "pid": pid, "tid": thread_id}
+                for name, start_ns, duration_ns, thread_id in events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def export_json(self, path):#导出统计快照
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+    def export_chrome_trace(self, path):#导出 Chrome trace 文件
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+# 全局实例，各模块共用
+tracer = Tracer(enabled=os.environ.get("TYPEFLOW_TRACE") == "1")
@@ -0,0 +1,121 @@
+# interval_stats.py
+from array import array
+
+from event_ring import KEY_CODE_BITS
+
+# 对数分桶：小于 16 微秒的值每微秒一个桶，之后每个 2 的幂区间再均分为 16 个桶，
+# 桶宽不超过值的 1/16（相对误差 < 6.25%）；超过 MAX_INTERVAL_US 的值记入最后一个桶
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_INTERVAL_US = (1 << 27) - 1        # 约 134 秒
+BUCKET_COUNT = SUB_BUCKETS + (MAX_INTERVAL_US.bit_length() - SUB_BUCKET_BITS) * SUB_BUCKETS
+
+
+def bucket_index(value_us):#微秒值 -> 桶序号
+    if value_us < SUB_BUCKETS:
+        return max(0, value_us)
+    value_us = min(value_us, MAX_INTERVAL_US)
+    shift = value_us.bit_length() - 1 - SUB_BUCKET_BITS
+    return SUB_BUCKETS + shift * SUB_BUCKETS + (value_us >> shift) - SUB_BUCKETS
+
+
+def bucket_bounds(index):#桶序号 -> 该桶包含的微秒范围 (下界, 上界)，两端都包含
+    if index < SUB_BUCKETS:
+        return index, index
+    shift, mantissa = divmod(index - SUB_BUCKETS, SUB_BUCKETS)
+    low = (SUB_BUCKETS + mantissa) << shift
+    return low, low + (1 << shift) - 1
+
+
+class IntervalHistogram:
+    # 按键间隔的流式直方图：固定 BUCKET_COUNT 个计数器，内存与按键次数无关
+    # 百分位数取所在桶的中点，误差不超过桶宽的一半
+    # unit_ns 为分桶的最小单位（默认 1 微秒，可记录到约 134 秒；更短的耗时可用更小的单位）
+
+    def __init__(self, unit_ns=1000):
+        self.unit_ns = unit_ns
+        self.buckets = array("Q", bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def reset(self):
+        self.buckets = array("Q", bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, interval_ns):
+        self.buckets[bucket_index(interval_ns // self.unit_ns)] += 1
+        self.count += 1
+        self.total_ns += interval_ns
+        if interval_ns > self.max_ns:
+            self.max_ns = interval_ns
+
+    def percentiles(self, qs=(50, 95, 99)):#返回 {q: 毫秒}，没有数据时为空字典
+        if not self.count:
+            return {}
+        # 每个百分位对应的名次（最近秩法），一次遍历桶即可全部求出
+        targets = sorted((max(1, -(-q * self.count // 100)), q) for q in qs)
+        result = {}
+        seen = 0
+        position = 0
+        for index, bucket_count in enumerate(self.buckets):
+            if not bucket_count:
+                continue
+            seen += bucket_count
+            while position < len(targets) and targets[position][0] <= seen:
+                low, high = bucket_bounds(index)
+                result[targets[position][1]] = (low + high) / 2 * self.unit_ns / 1e6
+                position += 1
+            if position == len(targets):
+                break
+        return {q: result[q] for q in qs}
+
+    def summary(self):#保存到测试记录中的摘要：次数、平均、p50/p95/p99、最大值（毫秒）和非空的桶
+        if not self.count:
+            return {"count": 0}
+        p = self.percentiles((50, 95, 99))
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ns / self.count / 1e6, 2),
+            "p50_ms": round(p[50], 2),
+            "p95_ms": round(p[95], 2),
+            "p99_ms": round(p[99], 2),
+            "max_ms": round(self.max_ns / 1e6, 2),
+            "buckets": {index: n for index, n in enumerate(self.buckets) if n}, # 稀疏直方图，可跨测试合并
+        }
+
+
+class BigramLatencyTable:
+    # 字符二元组（前一个字符 -> 当前字符）的平均间隔表，最多记录 max_bigrams 个不同的二元组，
+    # 表满后新出现的二元组只计入 overflow
+
+    def __init__(self, max_bigrams=4096):
+        self.max_bigrams = max_bigrams
+        self.table = {}      # (前一字符码 << 21 | 当前字符码) -> [次数, 总间隔 ns]
+        self.overflow = 0
+
+    def reset(self):
+        self.table = {}
+        self.overflow = 0
+
+    def record(self, previous_code, key_code, interval_ns):
+        key = (previous_code << KEY_CODE_BITS) | key_code
+        entry = self.table.get(key)
+        if entry is not None:
+            entry[0] += 1
+            entry[1] += interval_ns
+        elif len(self.table) < self.max_bigrams:
+            self.table[key] = [1, interval_ns]
+        else:
+            self.overflow += 1
+
+    def slowest(self, count=10, min_count=3):#平均间隔最长的二元组 [(二元组, 平均毫秒, 次数), ...]
+        mask = (1 << KEY_CODE_BITS) - 1
+        rows = [
+            (chr(key >> KEY_CODE_BITS) + chr(key & mask), total / n / 1e6, n)
+            for key, (n, total) in self.table.items() if n >= min_count
+        ]
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return [(bigram, round(mean_ms, 2), n) for bigram, mean_ms, n in rows[:count]]
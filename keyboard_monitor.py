@@ -1,58 +1,121 @@
 import time
-from pynput import keyboard
-from threading import Thread
+from threading import Thread, Condition, Lock
+from speed_window import RollingSpeedWindow
+from keystroke_timeline import KeystrokeTimeline
+from event_ring import SpscRing, pack_event, unpack_event, key_code_of
+from interval_stats import IntervalHistogram, BigramLatencyTable
+from instrumentation import tracer
 
 class KeyboardMonitor:
     
-    def __init__(self):
+    def __init__(self, timeline_spill_path=None, alert_mode="event", queue_capacity=4096):
         # 键盘监听器对象
         self.keyboard_listener = None
         
         # 是否正在监控
         self.is_monitoring = False
         
-        # 存储每次按键的时间
-        self.key_press_times = []
+        # 滑动窗口速度统计（1秒/5秒/30秒），内存与会话时长无关
+        self.speed_window = RollingSpeedWindow(windows=(1, 5, 30))
+        
+        # 完整的按键时间线（单调时钟，每次按键 8 字节；可选溢出到磁盘文件）
+        self.timeline = KeystrokeTimeline(spill_path=timeline_spill_path)
+        
+        # 按键间隔（IKI）直方图和字符二元组间隔表，固定内存，不保存原始事件
+        self.iki_histogram = IntervalHistogram()
+        self.bigram_latency = BigramLatencyTable()
+        
+        # 超过该间隔视为停顿，不计入间隔统计（纳秒）
+        self.iki_pause_ns = 2_000_000_000
+        self.last_key_ns = None
+        self.last_key_code = 0
         
         # 监控开始时间
         self.monitor_start_time = 0
         
-        # 上次提醒时间
-        self.last_alert_time = 0
+        # 上次提醒时间（None 表示还没有提醒过）
+        self.last_alert_time = None
         
         # 提醒冷却时间（秒）
         self.alert_cooldown = 10
         
         # 速度提醒回调函数
         self.speed_alert_callback = None
+        
+        # 提醒模式："event" 在每次按键时判断，只在无人输入时用定时等待处理速度回落；
+        # "poll" 为旧的每秒轮询一次
+        if alert_mode not in ("event", "poll"):
+            raise ValueError(f"未知的提醒模式: {alert_mode}")
+        self.alert_mode = alert_mode
+        
+        # 当前速度使用的窗口长度（秒）
+        self.alert_window = 5
+        
+        # 监听线程 -> 分析线程的事件队列：监听线程只做一次入队，统计都在分析线程完成
+        self.event_ring = SpscRing(queue_capacity)
+        
+        # 同一时刻只能有一个消费者取队列（分析线程或查询速度的界面线程）
+        self.drain_lock = Lock()
+        self.alert_lock = Lock()
+        self.idle_condition = Condition()
+        self.idle_waiting = False  # 分析线程是否在等待（队列为空）
     
     def start_monitoring(self, alert_callback):#开始键盘监控
         # 设置提醒回调函数
         self.speed_alert_callback = alert_callback
         
         # 重置监控数据
+        self._reset_session(time.perf_counter_ns())
+        self.event_ring.reset()
         self.is_monitoring = True
-        self.key_press_times = []
-        self.monitor_start_time = time.time()
-        self.last_alert_time = 0
         
-        # 启动键盘监听
+        # 启动键盘监听（pynput 在这里才导入，无显示环境下的回放不需要它）
+        from pynput import keyboard
         self.keyboard_listener = keyboard.Listener(on_press=self._on_key_press)
         self.keyboard_listener.start()
         
-        # 启动速度监控线程
-        self.monitor_thread = Thread(target=self._monitor_speed, daemon=True)
+        # 启动分析线程（事件模式下按键到达即处理，空闲时只等待速度回落的时刻）
+        if self.alert_mode == "event":
+            self.monitor_thread = Thread(target=self._run_analysis, daemon=True)
+        else:
+            self.monitor_thread = Thread(target=self._monitor_speed, daemon=True)
         self.monitor_thread.start()
         
         # 调试信息
         print("键盘监控已启动")
     
+    def start_replay(self, alert_callback, start_ns):#回放模式：不启动监听和分析线程，按键由 replay_key 提供
+        self.speed_alert_callback = alert_callback
+        self._reset_session(start_ns)
+        self.event_ring.reset()
+    
+    def replay_key(self, timestamp_ns, key_code=0):#回放一次按键（时间戳可以是模拟时钟），提醒在调用线程中判断
+        with self.drain_lock:
+            self._record_key(timestamp_ns, key_code)
+    
+    def _reset_session(self, start_ns):#重置会话数据
+        self.monitor_start_time = start_ns / 1e9
+        self.timeline.start(start_ns)
+        self.speed_window.reset(self.monitor_start_time)
+        self.last_alert_time = None
+        self.iki_histogram.reset()
+        self.bigram_latency.reset()
+        self.last_key_ns = None
+        self.last_key_code = 0
+    
     def stop_monitoring(self):
         self.is_monitoring = False
         
+        # 唤醒分析线程使其退出
+        with self.idle_condition:
+            self.idle_condition.notify_all()
+        
         if self.keyboard_listener:
             self.keyboard_listener.stop()
         
+        if self.event_ring.dropped:
+            print(f"事件队列已满，丢弃 {self.event_ring.dropped} 次按键")
+        
         print("键盘监控已停止")
 
     def _on_key_press(self, key):#键盘按键事件处理
@@ -60,37 +123,80 @@ class KeyboardMonitor:
         if not self.is_monitoring:
             return
         
-        # 记录按键时间
-        current_time = time.time()
-        self.key_press_times.append(current_time)
+        # 监听线程只打包入队（单调时钟），不做任何统计，避免拖慢系统键盘钩子
+        self.event_ring.push(pack_event(time.perf_counter_ns(), key_code_of(key)))
+        
+        # 分析线程在等待时才需要唤醒
+        if self.idle_waiting:
+            with self.idle_condition:
+                self.idle_condition.notify_all()
     
-    def _monitor_speed(self):#监控打字速度
-        print("速度监控线程启动")
+    def _drain_events(self):#取出队列中的所有按键并批量更新统计
+        with self.drain_lock:
+            for event in self.event_ring.drain():
+                timestamp_ns, key_code = unpack_event(event)
+                self._record_key(timestamp_ns, key_code)
+    
+    def _record_key(self, now_ns, key_code=0):#记录一次按键并更新滚动统计
+        self.timeline.append(now_ns)
+        self.speed_window.add(now_ns / 1e9)
+        self._record_interval(now_ns, key_code)
+        
+        if self.alert_mode == "event":
+            # 按键时立即判断是否越过阈值
+            self._evaluate_alert(now_ns / 1e9)
+    
+    def _record_interval(self, now_ns, key_code):#更新按键间隔直方图和二元组间隔表
+        if self.last_key_ns is not None:
+            interval_ns = now_ns - self.last_key_ns
+            if interval_ns <= self.iki_pause_ns:
+                self.iki_histogram.record(interval_ns)
+                if key_code and self.last_key_code:
+                    self.bigram_latency.record(self.last_key_code, key_code, interval_ns)
+        self.last_key_ns = now_ns
+        self.last_key_code = key_code
+    
+    def _evaluate_alert(self, current_time):#用当前窗口速度和平均速度判断一次
+        with self.alert_lock:
+            current_speed = self.speed_window.speed(self.alert_window, current_time)
+            
+            # 只有当有足够数据时才进行速度分析
+            if self.speed_window.total_count >= 10:
+                average_speed = self.speed_window.average_speed(current_time)
+                self._check_speed_alert(current_speed, average_speed, current_time)
+    
+    def _run_analysis(self):#事件模式的分析线程：批量处理队列中的按键
+        print("速度监控线程启动（事件模式）")
         
         while self.is_monitoring:
-            current_time = time.time()
+            self._drain_events()
             
-            # 计算最近5秒内的按键次数
-            time_5_seconds_ago = current_time - 5
-            recent_keys = [t for t in self.key_press_times if t >= time_5_seconds_ago]
+            # 没有按键时，当前速度只会在最早的按键移出窗口时变化
+            deadline = self.speed_window.next_expiry(self.alert_window)
+            now = time.perf_counter()
+            if deadline is not None and deadline <= now:
+                self._evaluate_alert(now)
+                continue
             
-            # 计算当前打字速度（字/分钟）
-            if len(recent_keys) > 0:
-                current_speed = (len(recent_keys) / 5) * 60
-            else:
-                current_speed = 0
+            with self.idle_condition:
+                # 先置标志再检查队列：监听线程在入队后检查标志，保证不会漏掉唤醒
+                self.idle_waiting = True
+                if not len(self.event_ring) and self.is_monitoring:
+                    # 窗口为空时当前速度为 0，不会触发提醒，一直等到下一次按键
+                    self.idle_condition.wait(None if deadline is None else deadline - now)
+                self.idle_waiting = False
+        
+        print("速度监控线程结束")
+    
+    def _monitor_speed(self):#监控打字速度
+        print("速度监控线程启动")
+        
+        while self.is_monitoring:
+            self._drain_events()
+            current_time = time.perf_counter()
             
-            # 只有当有足够数据时才进行速度分析
-            if len(self.key_press_times) >= 10:
-                total_duration = current_time - self.monitor_start_time
-                
-                if total_duration > 0:
-                    average_speed = (len(self.key_press_times) / total_duration) * 60
-                else:
-                    average_speed = 0
-                
-                # 检查速度是否异常
-                self._check_speed_alert(current_speed, average_speed, current_time)
+            # 计算当前打字速度并检查速度是否异常
+            self._evaluate_alert(current_time)
             
             # 每秒检查一次
             time.sleep(1)
@@ -103,7 +209,7 @@ class KeyboardMonitor:
             return
         
         # 检查是否在冷却时间内
-        if current_time - self.last_alert_time < self.alert_cooldown:
+        if self.last_alert_time is not None and current_time - self.last_alert_time < self.alert_cooldown:
             return
         
         # 计算当前速度与平均速度的比例
@@ -112,29 +218,47 @@ class KeyboardMonitor:
         # 如果速度变化超过50%，触发提醒
         if speed_ratio > 1.5:  # 速度过快（超过平均速度50%）
             message = f"当前速度: {current_speed:.1f} 字/分钟，平均: {average_speed:.1f} 字/分钟"
-            if self.speed_alert_callback:
-                self.speed_alert_callback("速度过快", message)
+            self._dispatch_alert("速度过快", message)
             self.last_alert_time = current_time
             
         elif speed_ratio < 0.5 and current_speed > 0:  # 速度过慢（低于平均速度50%）
             message = f"当前速度: {current_speed:.1f} 字/分钟，平均: {average_speed:.1f} 字/分钟"
-            if self.speed_alert_callback:
-                self.speed_alert_callback("速度过慢", message)
+            self._dispatch_alert("速度过慢", message)
             self.last_alert_time = current_time
     
-    def get_current_speed(self):#获取当前打字速度
-
-        if not self.key_press_times:
-            return 0
-        
-        current_time = time.time()
-        time_5_seconds_ago = current_time - 5
-        recent_keys = [t for t in self.key_press_times if t >= time_5_seconds_ago]
-        
-        if len(recent_keys) > 0:
-            return (len(recent_keys) / 5) * 60
-        else:
-            return 0
+    def _dispatch_alert(self, title, message):#调用提醒回调
+        tracer.count("alerts")
+        if self.speed_alert_callback:
+            with tracer.span("alert_dispatch"):
+                self.speed_alert_callback(title, message)
+    
+    def get_current_speed(self, current_time=None):#获取当前打字速度（最近5秒），current_time 默认为当前时间
+        self._drain_events()
+        if current_time is None:
+            current_time = time.perf_counter()
+        return self.speed_window.speed(self.alert_window, current_time)
+    
+    def get_window_speeds(self):#获取各窗口的速度 {1: 字/分钟, 5: ..., 30: ...}
+        self._drain_events()
+        return self.speed_window.speeds(time.perf_counter())
     
     def get_total_keystrokes(self):#获取总按键次数
-        return len(self.key_press_times)
+        self._drain_events()
+        return len(self.timeline)
+    
+    def get_iki_percentiles(self, qs=(50, 95, 99)):#获取按键间隔的百分位数 {q: 毫秒}
+        self._drain_events()
+        return self.iki_histogram.percentiles(qs)
+    
+    def get_iki_summary(self, slow_bigrams=5):#获取保存到测试记录中的按键间隔摘要
+        self._drain_events()
+        summary = self.iki_histogram.summary()
+        summary["slow_bigrams"] = self.bigram_latency.slowest(slow_bigrams)
+        return summary
+    
+    def get_slow_bigrams(self, count=10, min_count=3):#获取平均间隔最长的字符二元组
+        self._drain_events()
+        return self.bigram_latency.slowest(count, min_count)
+    
+    def get_dropped_events(self):#获取因事件队列已满而丢弃的按键次数
+        return self.event_ring.dropped
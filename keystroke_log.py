@@ -0,0 +1,198 @@
+# keystroke_log.py
+import json
+import zlib
+from array import array
+
+# 按键录制文件格式（.tfkl）：
+#   文件头：b"TFKL" + 版本（1 字节）+ 元数据长度（varint）+ 元数据（UTF-8 JSON）
+#   之后为若干块：标志（1 字节，bit0 = zlib 压缩）+ 事件数（varint）+ 数据长度（varint）+ 数据
+#   每个事件：时间增量（微秒，varint）+ 按键类别（varint）+ 字符位置增量（zigzag varint）
+#   第一个事件的时间增量为绝对时间（微秒）；增量跨块延续
+# 一般每次按键只需 3~5 字节，正常打字速度下每秒几十字节，压缩后更少
+
+MAGIC = b"TFKL"
+VERSION = 1
+FLAG_ZLIB = 1
+
+# 按键类别（按显示出的字符分类）
+KEY_CHAR = 0       # 西文字母、数字
+KEY_SPACE = 1      # 空格、制表符等空白
+KEY_NEWLINE = 2
+KEY_PUNCT = 3      # 标点、符号
+KEY_CJK = 4        # 中日韩文字
+KEY_END = 5        # 没有显示字符（文件已读完）
+
+
+def classify_key(text):#按显示出的文本（第一个字符）判断按键类别
+    if not text:
+        return KEY_END
+    char = text[0]
+    if char == "\n":
+        return KEY_NEWLINE
+    if char.isspace():
+        return KEY_SPACE
+    if char.isalnum():
+        return KEY_CJK if char >= "\u2e80" else KEY_CHAR
+    return KEY_PUNCT
+
+
+def _append_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):#返回 (值, 新位置)
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class KeystrokeRecorder:
+    # 把一次练习的按键事件（时间、按键类别、字符位置）写入紧凑的二进制文件
+    # 事件先在内存中编码，每 block_events 个写出一块；compress=True 时每块用 zlib 压缩
+
+    def __init__(self, path, meta=None, compress=True, block_events=1024):
+        self.path = path
+        self.compress = compress
+        self.block_events = block_events
+        self.pending = bytearray()   # 当前块已编码的事件
+        self.pending_count = 0
+        self.count = 0               # 已记录的事件总数
+        self.last_us = 0
+        self.last_offset = 0
+        self.file = open(path, "wb")
+        meta_bytes = json.dumps(meta or {}, ensure_ascii=False).encode("utf-8")
+        header = bytearray(MAGIC)
+        header.append(VERSION)
+        _append_varint(header, len(meta_bytes))
+        self.file.write(bytes(header) + meta_bytes)
+
+    def record(self, timestamp_ns, key_class, offset):#记录一次按键（timestamp_ns 为单调时钟纳秒，offset 为按键后的字符位置）
+        timestamp_us = timestamp_ns // 1000
+        out = self.pending
+        _append_varint(out, max(0, timestamp_us - self.last_us))
+        _append_varint(out, key_class)
+        delta = offset - self.last_offset
+        _append_varint(out, delta << 1 if delta >= 0 else (-delta << 1) - 1)   # zigzag：回退时为负数
+        self.last_us = max(self.last_us, timestamp_us)
+        self.last_offset = offset
+        self.pending_count += 1
+        self.count += 1
+        if self.pending_count >= self.block_events:
+            self._write_block()
+
+    def _write_block(self):
+        if not self.pending_count:
+            return
+        payload = bytes(self.pending)
+        flags = 0
+        if self.compress:
+            compressed = zlib.compress(payload, 6)
+            if len(compressed) < len(payload):
+                payload = compressed
+                flags |= FLAG_ZLIB
+        header = bytearray([flags])
+        _append_varint(header, self.pending_count)
+        _append_varint(header, len(payload))
+        self.file.write(bytes(header) + payload)
+        self.pending = bytearray()
+        self.pending_count = 0
+
+    def flush(self):#写出当前未满的块
+        self._write_block()
+        self.file.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+        self._write_block()
+        self.file.close()
+        self.file = None
+
+
+class KeystrokeLogReader:
+    # 读取按键录制文件：iter_events() 逐块流式读取，load_arrays() 一次性读入数组
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError(f"不是按键录制文件: {path}")
+        version = self.file.read(1)
+        if not version or version[0] != VERSION:
+            self.file.close()
+            raise ValueError(f"不支持的按键录制文件版本: {path}")
+        self.meta = json.loads(self.file.read(self._read_file_varint()).decode("utf-8"))
+        self.data_start = self.file.tell()
+
+    def _read_file_varint(self):
+        result = 0
+        shift = 0
+        while True:
+            byte = self.file.read(1)
+            if not byte:
+                raise EOFError
+            result |= (byte[0] & 0x7F) << shift
+            if byte[0] < 0x80:
+                return result
+            shift += 7
+
+    def iter_blocks(self):#逐块返回 (时间戳列表（纳秒）, 类别列表, 位置列表)；文件末尾不完整的块被忽略
+        self.file.seek(self.data_start)
+        last_us = 0
+        last_offset = 0
+        while True:
+            flags = self.file.read(1)
+            if not flags:
+                return
+            try:
+                count = self._read_file_varint()
+                length = self._read_file_varint()
+            except EOFError:
+                return
+            payload = self.file.read(length)
+            if len(payload) < length:
+                return
+            if flags[0] & FLAG_ZLIB:
+                payload = zlib.decompress(payload)
+
+            timestamps = [0] * count
+            classes = [0] * count
+            offsets = [0] * count
+            pos = 0
+            for i in range(count):
+                delta_us, pos = _read_varint(payload, pos)
+                key_class, pos = _read_varint(payload, pos)
+                zigzag, pos = _read_varint(payload, pos)
+                last_us += delta_us
+                last_offset += (zigzag >> 1) if not zigzag & 1 else -((zigzag + 1) >> 1)
+                timestamps[i] = last_us * 1000
+                classes[i] = key_class
+                offsets[i] = last_offset
+            yield timestamps, classes, offsets
+
+    def iter_events(self):#逐个返回 (时间戳纳秒, 按键类别, 字符位置)
+        for timestamps, classes, offsets in self.iter_blocks():
+            yield from zip(timestamps, classes, offsets)
+
+    def load_arrays(self):#一次读入全部事件：(array('q') 时间戳, array('B') 类别, array('q') 位置)
+        timestamps = array("q")
+        classes = array("B")
+        offsets = array("q")
+        for block in self.iter_blocks():
+            timestamps.extend(block[0])
+            classes.extend(block[1])
+            offsets.extend(block[2])
+        return timestamps, classes, offsets
+
+    def close(self):
+        self.file.close()
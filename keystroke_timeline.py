@@ -0,0 +1,122 @@
+# keystroke_timeline.py
+import mmap
+import time
+from array import array
+
+
+class KeystrokeTimeline:
+    # 紧凑的按键时间线：每次按键只存一个 int64（相对会话起点的 perf_counter_ns 纳秒偏移）
+    # 使用单调时钟，不受系统时间调整影响；按固定大小分块增长，避免大数组整体复制
+    # 指定 spill_path 时，写满的块会追加到磁盘文件并通过 mmap 读取，内存中只保留当前块
+
+    def __init__(self, chunk_size=4096, spill_path=None):
+        self.chunk_size = chunk_size
+        self.spill_path = spill_path
+        self.origin_ns = None       # 会话起点（perf_counter_ns）
+        self.chunks = []            # 已写满的内存块
+        self.current = array('q')   # 正在写入的块
+        self.length = 0
+        self.spill_file = None
+        self.spilled_count = 0      # 已写入磁盘的按键数
+        self.spill_map = None
+        self.spill_map_count = 0    # spill_map 覆盖的按键数
+
+    def start(self, origin_ns=None):#开始新的时间线（清空旧数据）
+        self.close()
+        self.origin_ns = time.perf_counter_ns() if origin_ns is None else origin_ns
+        self.chunks = []
+        self.current = array('q')
+        self.length = 0
+        self.spilled_count = 0
+        if self.spill_path:
+            self.spill_file = open(self.spill_path, 'w+b')
+
+    def append(self, timestamp_ns=None):#记录一次按键，timestamp_ns 默认为当前 perf_counter_ns
+        if timestamp_ns is None:
+            timestamp_ns = time.perf_counter_ns()
+        if self.origin_ns is None:
+            self.start(timestamp_ns)
+
+        self.current.append(timestamp_ns - self.origin_ns)
+        self.length += 1
+        if len(self.current) >= self.chunk_size:
+            self._seal_current()
+
+    def _seal_current(self):#当前块写满：放入内存块列表或写入磁盘
+        if self.spill_file is not None:
+            self.current.tofile(self.spill_file)
+            self.spill_file.flush()
+            self.spilled_count += len(self.current)
+        else:
+            self.chunks.append(self.current)
+        self.current = array('q')
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):#第index次按键的纳秒偏移
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("按键序号超出范围")
+
+        if index < self.spilled_count:
+            return self._spill_view()[index]
+        index -= self.spilled_count
+        chunk_index, offset = divmod(index, self.chunk_size)
+        if chunk_index < len(self.chunks):
+            return self.chunks[chunk_index][offset]
+        return self.current[offset]
+
+    def _spill_view(self):#磁盘部分的 int64 视图（按需重新映射）
+        if self.spill_map is None or self.spill_map_count != self.spilled_count:
+            self._release_map()
+            self.spill_map = mmap.mmap(self.spill_file.fileno(), self.spilled_count * 8,
+                                       access=mmap.ACCESS_READ)
+            self.spill_map_count = self.spilled_count
+        return memoryview(self.spill_map).cast('q')
+
+    def memoryviews(self):#按顺序返回各块数据的 memoryview（不复制，格式 'q'）
+        # 使用完请释放返回的视图，否则 close() 时无法解除磁盘映射
+        views = []
+        if self.spilled_count:
+            views.append(self._spill_view())
+        views.extend(memoryview(chunk) for chunk in self.chunks)
+        if self.current:
+            views.append(memoryview(self.current))
+        return views
+
+    def to_array(self):#复制为一个连续的 array('q')
+        result = array('q')
+        for view in self.memoryviews():
+            result.frombytes(view.tobytes())
+            view.release()
+        return result
+
+    def last_ns(self):#最后一次按键的偏移，没有按键时为 None
+        if self.length == 0:
+            return None
+        return self[self.length - 1]
+
+    def elapsed(self, now_ns=None):#会话起点到now_ns（默认当前时间）经过的秒数
+        if self.origin_ns is None:
+            return 0.0
+        if now_ns is None:
+            now_ns = time.perf_counter_ns()
+        return max(0.0, (now_ns - self.origin_ns) / 1e9)
+
+    def _release_map(self):
+        if self.spill_map is not None:
+            try:
+                self.spill_map.close()
+            except BufferError:
+                # 外部仍持有视图时保留映射，由垃圾回收释放
+                pass
+            self.spill_map = None
+            self.spill_map_count = 0
+
+    def close(self):#关闭磁盘文件（内存中的数据保留）
+        self._release_map()
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
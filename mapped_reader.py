@@ -0,0 +1,132 @@
+# mapped_reader.py
+import codecs
+import io
+import mmap
+from bisect import bisect_right
+
+
+class MappedTextReader:
+    # 基于 mmap 的可随机定位文本读取器，接口与文本文件对象的 read(size) 相同，可直接交给 TypeWriter
+    # 读取时按字节块增量解码，并沿途记录稀疏索引（字符偏移 -> 字节偏移 + 解码器状态），
+    # 因此 seek(字符位置) 只需二分查找最近的检查点，再解码不超过一个间隔的内容
+    # 打开文件不读取内容，内存占用与文件大小无关
+
+    supports_char_seek = True
+
+    def __init__(self, file_path, encoding, block_size=16384, checkpoint_interval=8192):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.block_size = block_size                    # 每次解码的字节数
+        self.checkpoint_interval = checkpoint_interval  # 检查点之间至少间隔的字符数
+
+        self.file = open(file_path, "rb")
+        self.size = self.file.seek(0, io.SEEK_END)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.decoder_factory = codecs.getincrementaldecoder(encoding)
+
+        # 稀疏索引：三个列表一一对应，按字符偏移递增
+        initial = self._new_decoder()
+        self.index_chars = [0]
+        self.index_bytes = [0]
+        self.index_states = [initial.getstate()]
+        self.total_chars = None    # 解码到文件末尾后才知道总字符数
+
+        self.char_pos = 0          # 下一次 read 返回的第一个字符的位置
+        self._set_cursor(initial, 0, 0, "")
+
+    def _new_decoder(self):#换行符统一为 \n，与文本模式 open() 的行为一致
+        return io.IncrementalNewlineDecoder(self.decoder_factory(), True)
+
+    def _set_cursor(self, decoder, byte_pos, block_char_pos, pending):
+        self.decoder = decoder
+        self.byte_pos = byte_pos              # 下一个要解码的字节位置
+        self.block_char_pos = block_char_pos  # byte_pos 对应的字符位置
+        self.pending = pending                # 已解码但还没返回的字符
+        self.pending_pos = 0
+
+    def _decode_block(self, decoder, byte_pos, char_pos):#解码一个字节块，返回 (文本, 新字节位置)
+        end = min(byte_pos + self.block_size, self.size)
+        final = end >= self.size
+        data = self.map[byte_pos:end] if self.map is not None else b""
+        text = decoder.decode(data, final)
+        new_char_pos = char_pos + len(text)
+
+        if final:
+            self.total_chars = new_char_pos
+        elif new_char_pos >= self.index_chars[-1] + self.checkpoint_interval:
+            # 只在解码器没有残留字节、也没有待定的 \r 时记录检查点
+            state = decoder.getstate()
+            if not state[0] and not state[1] & 1:
+                self.index_chars.append(new_char_pos)
+                self.index_bytes.append(end)
+                self.index_states.append(state)
+        return text, end
+
+    def _locate(self, char_index):#返回 (解码器, 字节位置, 该块起始字符位置, 从char_index开始的剩余文本)
+        checkpoint = bisect_right(self.index_chars, char_index) - 1
+        char_pos = self.index_chars[checkpoint]
+        byte_pos = self.index_bytes[checkpoint]
+        decoder = self._new_decoder()
+        decoder.setstate(self.index_states[checkpoint])
+
+        # 从检查点向前解码，直到包含目标位置（超出已索引范围时会顺便补充索引）
+        while byte_pos < self.size:
+            text, next_byte_pos = self._decode_block(decoder, byte_pos, char_pos)
+            byte_pos = next_byte_pos
+            if char_pos + len(text) > char_index:
+                return decoder, byte_pos, char_pos + len(text), text[char_index - char_pos:]
+            char_pos += len(text)
+        return decoder, byte_pos, char_pos, ""
+
+    def read(self, size=-1):#读取最多size个字符，文件末尾返回空字符串
+        parts = []
+        remaining = size if size >= 0 else float("inf")
+        while remaining > 0:
+            if self.pending_pos >= len(self.pending):
+                if self.byte_pos >= self.size:
+                    break
+                text, self.byte_pos = self._decode_block(self.decoder, self.byte_pos, self.block_char_pos)
+                self.block_char_pos += len(text)
+                self.pending = text
+                self.pending_pos = 0
+                continue
+
+            piece_end = self.pending_pos + remaining if size >= 0 else len(self.pending)
+            piece = self.pending[self.pending_pos:piece_end]
+            self.pending_pos += len(piece)
+            remaining -= len(piece)
+            parts.append(piece)
+
+        result = "".join(parts)
+        self.char_pos += len(result)
+        return result
+
+    def seek(self, char_index):#跳到第char_index个字符，返回实际位置（超出文件末尾时停在末尾）
+        char_index = max(0, char_index)
+        decoder, byte_pos, block_char_pos, remainder = self._locate(char_index)
+        self._set_cursor(decoder, byte_pos, block_char_pos, remainder)
+        self.char_pos = block_char_pos - len(remainder)
+        return self.char_pos
+
+    def tell(self):
+        return self.char_pos
+
+    def read_range(self, start, end):#读取[start, end)范围的字符，不改变当前读取位置
+        start = max(0, start)
+        if end <= start:
+            return ""
+        decoder, byte_pos, block_char_pos, text = self._locate(start)
+        parts = [text]
+        length = len(text)
+        while length < end - start and byte_pos < self.size:
+            text, byte_pos = self._decode_block(decoder, byte_pos, block_char_pos)
+            block_char_pos += len(text)
+            parts.append(text)
+            length += len(text)
+        return "".join(parts)[:end - start]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
@@ -0,0 +1,88 @@
+# playlist.py
+import os
+import threading
+
+from utils import detect_encoding
+
+TEXT_EXTENSIONS = (".txt",)
+
+
+def collect_files(paths, extensions=TEXT_EXTENSIONS):#展开路径列表：目录按名称顺序递归加入其中的文本文件，文件按原样加入
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(extensions))
+        else:
+            files.append(path)
+    return files
+
+
+class Playlist:
+    # 播放列表：把多个文件（或整个目录）串成一次连续的练习
+    # 每打开一个文件，就在后台线程检测下一个文件的编码、预先打开并解码第一块（TypeWriter.preopen），
+    # 当前文件读完时直接切换，不需要等待编码检测和磁盘
+    # detect 为编码检测函数（路径 -> 编码或 None），无法识别编码的文件会被跳过
+
+    def __init__(self, paths, detect=detect_encoding, extensions=TEXT_EXTENSIONS, use_mmap=True):
+        self.files = collect_files(paths, extensions)
+        self.detect = detect
+        self.use_mmap = use_mmap
+        self.position = -1              # 当前文件在 files 中的位置
+        self.prepared = None            # 后台准备好的下一个文件：(位置, 编码)
+        self.prepare_thread = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def current(self):#当前文件路径，尚未开始时为 None
+        return self.files[self.position] if 0 <= self.position < len(self.files) else None
+
+    def has_next(self):
+        return self.position + 1 < len(self.files)
+
+    def _detect(self, path):
+        try:
+            return self.detect(path)
+        except OSError as error:
+            print(f"读取文件时出错: {error}")
+            return None
+
+    def advance(self):#移到下一个可用的文件，返回 (路径, 编码)；没有更多文件时返回 None
+        self._join()
+        while self.has_next():
+            self.position += 1
+            path = self.files[self.position]
+            if self.prepared is not None and self.prepared[0] == self.position:
+                encoding = self.prepared[1]
+            else:
+                encoding = self._detect(path)
+            self.prepared = None
+            if encoding:
+                return path, encoding
+            print(f"跳过无法识别编码的文件: {path}")
+        return None
+
+    def prepare_next(self, typewriter):#在后台线程准备下一个文件（检测编码并由 typewriter 预先打开）
+        self._join()
+        if not self.has_next():
+            return
+        self.prepare_thread = threading.Thread(target=self._prepare, args=(typewriter, self.position + 1), daemon=True)
+        self.prepare_thread.start()
+
+    def _prepare(self, typewriter, position):
+        path = self.files[position]
+        encoding = self._detect(path)
+        if encoding:
+            try:
+                typewriter.preopen(path, encoding, use_mmap=self.use_mmap)
+            except (OSError, ValueError, LookupError) as error:
+                # 预先打开失败时，切换时再按普通方式打开
+                print(f"预先打开文件时出错: {error}")
+        self.prepared = (position, encoding)
+
+    def _join(self):#等待后台准备完成
+        if self.prepare_thread is not None:
+            self.prepare_thread.join()
+            self.prepare_thread = None
@@ -0,0 +1,112 @@
+# prefetch.py
+import queue
+import threading
+
+
+class ReadAheadReader:
+    # 后台预读：后台线程提前从 source 读取并解码接下来的 depth 个块放入队列，
+    # 界面线程的 read() 只从队列取已经准备好的文本，不直接访问磁盘
+    # source 需要提供 read(size)；若还提供 seek/read_range，本类同样支持
+
+    def __init__(self, source, chunk_size=4096, depth=4):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.depth = depth
+        self.supports_char_seek = getattr(source, "supports_char_seek", False)
+        # 读取缓存（CachedTextReader）时的行首、词首表，只读，不需要加锁
+        self.total_chars = getattr(source, "total_chars", None)
+        self.line_offsets = getattr(source, "line_offsets", None)
+        self.word_offsets = getattr(source, "word_offsets", None)
+
+        self.lock = threading.Lock()   # 保护 source，后台线程与 seek/read_range 互斥
+        self.generation = 0            # 每次 seek/close 加一，旧的后台线程看到后退出
+        self.queue = None
+        self.leftover = ""             # 上次取出但未用完的块
+        self.eof = False
+        self.ready_reads = 0           # 数据已就绪、无需等待的块数
+        self.waited_reads = 0          # 需要等待后台线程的块数
+        self._start_worker()
+
+    def _start_worker(self):
+        self.queue = queue.Queue(maxsize=self.depth)
+        self.leftover = ""
+        self.eof = False
+        self.error = None              # 后台线程读取出错时的异常，read() 中重新抛出
+        worker = threading.Thread(target=self._worker, args=(self.generation, self.queue), daemon=True)
+        worker.start()
+
+    def _worker(self, generation, chunk_queue):#后台线程：读到文件末尾、出错或被新的 seek 取代为止
+        while True:
+            with self.lock:
+                if generation != self.generation:
+                    return
+                try:
+                    chunk = self.source.read(self.chunk_size)
+                except Exception as error:
+                    # 例如文件中间有无法解码的字节：把异常交给 read()，否则界面线程会一直等待
+                    chunk = error
+            while True:
+                try:
+                    chunk_queue.put(chunk, timeout=0.5)
+                    break
+                except queue.Full:
+                    if generation != self.generation:
+                        return
+            if not chunk or isinstance(chunk, Exception):
+                return
+
+    def _stop_worker(self):#让当前后台线程退出（调用方需持有 self.lock）
+        self.generation += 1
+        # 清空旧队列，让阻塞在 put 上的旧线程尽快退出
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def read(self, size=-1):#与文件对象的 read 相同：返回最多size个字符，末尾返回空字符串
+        parts = []
+        remaining = size if size >= 0 else float("inf")
+        while remaining > 0:
+            if not self.leftover:
+                if self.error is not None:
+                    raise self.error
+                if self.eof:
+                    break
+                if self.queue.empty():
+                    self.waited_reads += 1
+                else:
+                    self.ready_reads += 1
+                chunk = self.queue.get()
+                if isinstance(chunk, Exception):
+                    self.error = chunk
+                    raise chunk
+                if not chunk:
+                    self.eof = True
+                    break
+                self.leftover = chunk
+
+            if size >= 0:
+                piece = self.leftover[:remaining]
+            else:
+                piece = self.leftover
+            self.leftover = self.leftover[len(piece):]
+            remaining -= len(piece)
+            parts.append(piece)
+        return "".join(parts)
+
+    def seek(self, position):#定位 source 后重新开始预读
+        with self.lock:
+            self._stop_worker()
+            position = self.source.seek(position)
+            self._start_worker()
+        return position
+
+    def read_range(self, start, end):
+        with self.lock:
+            return self.source.read_range(start, end)
+
+    def close(self):
+        with self.lock:
+            self._stop_worker()
+            self.source.close()
@@ -0,0 +1,104 @@
+# segment_index.py
+import re
+from array import array
+from bisect import bisect_right
+
+REVEAL_MODES = ("char", "word", "line", "sentence")   # 每次按键显示：一个字符 / 一个词 / 一行 / 一句
+LINE_SEGMENT_MAX = 1024   # 逐行显示时超长的行按这个长度切开
+
+# 中日文字：每个字单独成词（韩文有空格分词，按西文处理）
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\U00020000-\U0002fa1f"
+_CLOSERS = "\"'”’)\\]）」』》"
+_OPENERS = "“‘(\\[（「『《"
+_TERMINATORS = ".!?。！？…"
+
+# 每种模式一个正则，依次匹配整段（内容 + 其后的空白），所有匹配首尾相接、覆盖全部文本
+# 每段长度有上限，流式扫描时只需保留最后一段未确定的内容
+_SEGMENT_PATTERNS = {
+    # 词：可选的前导标点 + （一个汉字及其后的标点（不含左引号、左括号） | 一串非空白的西文字符）+ 空白
+    "word": re.compile(
+        rf"[^\s\w]{{0,8}}(?:[{_CJK}][^\s\w{_OPENERS}]{{0,8}}|[^\s{_CJK}]{{1,64}})\s{{0,64}}|\s{{1,64}}|[\s\S]"),
+    # 行：到换行符为止（含换行符），超长的行按 1024 个字符切开
+    "line": re.compile(rf"[^\n]{{1,{LINE_SEGMENT_MAX}}}\n?|\n"),
+    # 句：到句末标点（西文标点后须为空白或结尾，避免拆开 3.14）及其后的引号、括号、空白为止
+    "sentence": re.compile(
+        rf"(?:[^{_TERMINATORS}]|[.!?](?=[^\s{_TERMINATORS}{_CLOSERS}])){{1,512}}"
+        rf"[{_TERMINATORS}]*[{_CLOSERS}]*\s{{0,64}}|[{_TERMINATORS}]+[{_CLOSERS}]*\s{{0,64}}|[\s\S]"),
+}
+
+
+class _SegmentTrack:
+    # 一种模式的分段结果：已扫描范围 [origin, scanned_to) 内每段的起始位置
+    # 最后一段可能延续到下一块，保留其文本（pending），下一块到来时从该段开头继续扫描
+
+    def __init__(self, pattern, origin):
+        self.pattern = pattern
+        self.reset(origin)
+
+    def reset(self, origin):
+        self.starts = array("q")
+        self.origin = origin
+        self.scanned_to = origin
+        self.pending = ""
+        self.pending_pos = origin
+
+    def feed(self, position, text):
+        end = position + len(text)
+        if self.origin <= position <= self.scanned_to:
+            if end <= self.scanned_to:
+                return                          # 已扫描过（回退后重新读取），不再重复扫描
+            text = text[self.scanned_to - position:]
+        else:
+            self.reset(position)                # 与已扫描范围不相接（向前跳转或跳到开头之前），重新开始
+        if not text:
+            return
+
+        scan = self.pending + text
+        base = self.pending_pos
+        starts = self.starts
+        last = None
+        for last in self.pattern.finditer(scan):
+            start = base + last.start()
+            if not starts or start > starts[-1]:
+                starts.append(start)
+        self.pending = scan[last.start():]
+        self.pending_pos = base + last.start()
+        self.scanned_to = end
+
+    def next_boundary(self, position):#position 之后的第一个段首，尚未扫描到时返回 None
+        i = bisect_right(self.starts, position)
+        return self.starts[i] if i < len(self.starts) else None
+
+
+class SegmentIndex:
+    # 流式分段索引：TypeWriter 每读入一块文本就交给 feed()，只对启用过的模式分段
+    # 回退（seek 到已扫描范围内）后不会重新扫描；按段显示时只需查找下一个段首再切片
+
+    def __init__(self):
+        self.tracks = {}   # 模式 -> _SegmentTrack
+
+    def track(self, mode, position, text=""):#开始为 mode 建立索引（已启用时不做任何事），text 为 position 起已读入的内容
+        if mode not in _SEGMENT_PATTERNS:
+            raise ValueError(f"未知的分段模式: {mode}")
+        if mode not in self.tracks:
+            self.tracks[mode] = _SegmentTrack(_SEGMENT_PATTERNS[mode], position)
+            self.tracks[mode].feed(position, text)
+
+    def feed(self, position, text):#读入从 position 开始的一块文本
+        for track in self.tracks.values():
+            track.feed(position, text)
+
+    def next_boundary(self, mode, position):
+        return self.tracks[mode].next_boundary(position)
+
+    def boundaries(self, mode):#mode 已确定的段首位置（array('q')）
+        return self.tracks[mode].starts
+
+    def pop_settled(self, mode):#取出并删除 mode 已确定的段首（保留最后一个），用于把索引边扫描边写出；之后不能再查询
+        starts = self.tracks[mode].starts
+        settled = starts[:-1]
+        del starts[:-1]
+        return settled
+
+    def clear(self):#打开新文件时清空（不保留已启用的模式）
+        self.tracks = {}
@@ -0,0 +1,250 @@
+# session.py
+import datetime
+import os
+import time
+
+from keystroke_log import KeystrokeRecorder, classify_key
+from keystroke_timeline import KeystrokeTimeline
+
+
+class TypingSession:
+    # 一次打字练习的核心逻辑（按键 -> 取下一个字符 -> 统计 -> 保存），不依赖 Tk，
+    # 界面和无界面的回放/模拟共用这一份逻辑
+    # live=True 时启动 KeyboardMonitor 的全局键盘监听（界面使用）；
+    # live=False 时不启动监听线程，按键时间直接交给监控器（回放使用，时间戳可以是模拟的）
+    # clock 返回纳秒时间戳，默认为 perf_counter_ns；回放时可以传入模拟时钟
+    # monitor_factory 用于延迟创建 KeyboardMonitor：第一次有效按键时才调用（加快启动）
+    # reveal_mode 为每次按键显示的单位："char"（默认）、"word"、"line"、"sentence"
+    # open_playlist() 打开播放列表：一个文件读完时自动切换到下一个，整个列表为一次练习，记录中附带每个文件的统计
+    # record_dir 不为空时把每次练习的按键写入该目录下的 .tfkl 文件（keystroke_log），可用于回放和重新分析；
+    # 目录中只保留最近的 record_keep 个录制文件，新建录制时删除更早的
+
+    def __init__(self, typewriter, data_manager, keyboard_monitor=None, live=False, clock=time.perf_counter_ns,
+                 monitor_factory=None, record_dir=None, record_keep=100):
+        self.typewriter = typewriter
+        self.data_manager = data_manager
+        self.keyboard_monitor = keyboard_monitor
+        self.monitor_factory = monitor_factory
+        self.live = live
+        self.clock = clock
+        self.alert_callback = None   # 速度提醒回调 (标题, 消息)
+        self.file_callback = None    # 播放列表切换到下一个文件时的回调 (路径, 编码)
+        self.reveal_mode = "char"
+        self.file_path = None
+        self.playlist = None
+        self.record_dir = record_dir
+        self.record_keep = record_keep
+        self.recorder = None
+        self.reset()
+
+    def reset(self):#清空统计（不关闭文件）
+        if self.recorder is not None:
+            self.recorder.close()    # 未结束的录制保留已记录的部分
+        self.recorder = None
+        self.start_offset = 0
+        self.started = False
+        self.stopped = False
+        self.key_timeline = KeystrokeTimeline() # 有效按键的时间线（单调时钟），起点即开始时间
+        self.end_ns = None
+        self.typed_chars = 0
+        self.result = None           # 结束后为 (保存的记录, 统计)
+        self.file_stats = []         # 播放列表中已读完的各文件统计
+        self.file_mark = (0, 0, 0.0) # 当前文件开始时的 (显示字符数, 按键数, 已用秒数)
+
+    def open(self, file_path, encoding, start_pos=0, use_mmap=True):#重置统计并打开文件
+        self.reset()
+        self.playlist = None
+        self.typewriter.open_file(file_path, encoding, use_mmap=use_mmap, start_pos=start_pos) # 调用typewriter包
+        self.file_path = file_path
+        self.start_offset = start_pos
+
+    def open_playlist(self, playlist):#重置统计并打开播放列表的第一个文件，没有可用文件时返回 False
+        self.reset()
+        self.playlist = playlist
+        return self._open_next_file()
+
+    def _open_next_file(self):#打开播放列表的下一个文件，并在后台准备再下一个
+        while True:
+            entry = self.playlist.advance()
+            if entry is None:
+                return False
+            file_path, encoding = entry
+            try:
+                self.typewriter.open_file(file_path, encoding, use_mmap=self.playlist.use_mmap) # 调用typewriter包
+            except (OSError, ValueError, LookupError) as error:
+                print(f"打开文件时出错，跳过: {error}")
+                continue
+            self.file_path = file_path
+            self.playlist.prepare_next(self.typewriter)
+            return True
+
+    def _create_recorder(self):#第一次有效按键时创建本次练习的按键录制文件
+        os.makedirs(self.record_dir, exist_ok=True)
+        self._prune_records(self.record_keep - 1)
+        now = datetime.datetime.now()
+        path = os.path.join(self.record_dir, f"session_{now:%Y%m%d_%H%M%S_%f}.tfkl")
+        meta = {
+            "started_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "file_path": self.file_path,
+            "encoding": self.typewriter.encoding,
+            "start_offset": self.start_offset,
+            "reveal_mode": self.reveal_mode,
+            "playlist": self.playlist.files if self.playlist is not None else None,
+        }
+        return KeystrokeRecorder(path, meta)
+
+    def _prune_records(self, keep):#删除录制目录中较早的录制文件，只保留最近的 keep 个（文件名按时间排序）
+        names = sorted(name for name in os.listdir(self.record_dir)
+                       if name.startswith("session_") and name.endswith(".tfkl"))
+        for name in names[:max(0, len(names) - keep)]:
+            try:
+                os.remove(os.path.join(self.record_dir, name))
+            except OSError as error:
+                print(f"删除按键录制文件时出错: {error}")
+
+    def _close_file_stats(self, file_path, now_ns, keys, finished):#记录一个文件的统计（keys 为截至该文件结束的按键总数）
+        chars_before, keys_before, seconds_before = self.file_mark
+        seconds = self.key_timeline.elapsed(now_ns) if self.started else 0.0
+        duration = seconds - seconds_before
+        chars = self.typed_chars - chars_before
+        self.file_stats.append({
+            "file_name": os.path.basename(file_path),
+            "file_path": file_path,
+            "typed_chars": chars,
+            "keys": keys - keys_before,
+            "duration": round(duration, 2),
+            "wpm_estimated": round((chars / 5.0) / (duration / 60.0), 2) if duration > 0 else 0.0,
+            "finished": finished,
+        })
+        self.file_mark = (self.typed_chars, keys, seconds)
+
+    def _read_next(self):
+        if self.reveal_mode == "char":
+            return self.typewriter.get_next_char() # 调用typewriter包
+        return self.typewriter.get_next_segment(self.reveal_mode)
+
+    def key_press(self, timestamp_ns=None, key_code=None):#处理一次有效按键，返回显示的字符（按词/行/句显示时为一段）；未加载、已停止或文件读完时返回 None
+        if not self.typewriter.loaded or self.stopped:
+            return None
+
+        now_ns = self.clock() if timestamp_ns is None else timestamp_ns
+
+        # 第一次有效按键时启动计时与监控
+        if not self.started:
+            self.started = True
+            self.key_timeline.start(now_ns)
+            if self.keyboard_monitor is None and self.monitor_factory is not None:
+                self.keyboard_monitor = self.monitor_factory()
+            if self.keyboard_monitor is not None:
+                if self.live:
+                    self.keyboard_monitor.start_monitoring(self.alert_callback)
+                else:
+                    self.keyboard_monitor.start_replay(self.alert_callback, now_ns)
+            if self.record_dir:
+                self.recorder = self._create_recorder()
+
+        # 记录按键时间（有效）
+        self.key_timeline.append(now_ns)
+
+        # 获取下一个字符（或下一段）；播放列表中当前文件读完时切换到下一个文件（本次按键属于下一个文件）
+        char = self._read_next()
+        while char is None and self.playlist is not None:
+            finished_path = self.file_path
+            if not self._open_next_file():
+                break
+            self._close_file_stats(finished_path, now_ns, len(self.key_timeline) - 1, finished=True)
+            if self.file_callback:
+                self.file_callback(self.file_path, self.typewriter.encoding)
+            char = self._read_next()
+
+        if self.keyboard_monitor is not None and not self.live:
+            # 回放时没有真实按键，默认按显示出的字符记录按键码
+            if key_code is None:
+                key_code = ord(char[0]) if char else 0
+            self.keyboard_monitor.replay_key(now_ns, key_code)
+
+        if self.recorder is not None:
+            self.recorder.record(now_ns, classify_key(char), self.typewriter.tell())
+
+        if char is None:
+            # 文件已读完
+            self.finish(now_ns, finished=True)
+            return None
+
+        self.typed_chars += len(char)
+        return char
+
+    def finish(self, timestamp_ns=None, finished=False):#结束会话并保存，返回 (记录, 统计)
+        if self.result is not None:
+            return self.result
+        if not self.end_ns:
+            self.end_ns = self.clock() if timestamp_ns is None else timestamp_ns
+        self.stopped = True
+        if self.started and self.live and self.keyboard_monitor is not None:
+            self.keyboard_monitor.stop_monitoring()   # 停止监控
+
+        if self.playlist is not None:
+            self._close_file_stats(self.file_path, self.end_ns, len(self.key_timeline), finished)
+        if self.recorder is not None:
+            self.recorder.close()
+        stats = self.compute_stats()
+        record = self._build_record(stats, finished)
+        self.data_manager.save_test(record) # 保存到 data_manager
+        self.result = (record, stats)
+        return self.result
+
+    def compute_stats(self):
+        # 时长与按键数都从按键时间线读取；未结束时计算到当前时刻
+        total_time = self.key_timeline.elapsed(self.end_ns if self.end_ns else self.clock())
+
+        chars = self.typed_chars
+        keys = len(self.key_timeline)
+        cps = chars / total_time if total_time > 0 else 0.0
+        wpm = (chars / 5.0) / (total_time / 60.0) if total_time > 0 else 0.0
+
+        return {
+            "chars": chars,
+            "keys": keys,
+            "time_s": round(total_time, 2),
+            "cps": round(cps, 2),
+            "wpm": round(wpm, 2)
+        }
+
+    def _build_record(self, stats, finished):
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        monitor = self.keyboard_monitor
+        # 回放时按模拟时钟计算即时速度；实时模式使用当前时间
+        current_time = None if self.live or self.end_ns is None else self.end_ns / 1e9
+        try:
+            current_speed = round(monitor.get_current_speed(current_time), 2) # 调用keyboard_monitor包
+        except Exception:
+            current_speed = round(stats["cps"] * 60, 2)  # fallback
+
+        try:
+            total_keystrokes = monitor.get_total_keystrokes() # 调用keyboard_monitor包
+        except Exception:
+            total_keystrokes = stats["keys"]
+
+        try:
+            iki = monitor.get_iki_summary() # 按键间隔摘要（百分位数、稀疏直方图、最慢的二元组）
+        except Exception:
+            iki = {"count": 0}
+
+        record = {
+            "timestamp": timestamp,
+            "speed": current_speed,
+            "duration": stats["time_s"],
+            "typed_chars": stats["chars"],
+            "total_keystrokes": total_keystrokes,
+            "wpm_estimated": stats["wpm"],
+            "file_name": os.path.basename(self.file_path) if self.file_path else None,
+            "file_path": self.file_path,
+            "end_offset": self.typewriter.tell(), # 停止时的字符位置，用于下次继续
+            "finished": finished,
+            "iki": iki
+        }
+        if self.playlist is not None:
+            record["files"] = list(self.file_stats) # 播放列表中每个文件的统计
+        if self.recorder is not None:
+            record["keystroke_log"] = self.recorder.path
+        return record
@@ -0,0 +1,189 @@
+# simulator.py
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from data_manager import DataManager
+from interval_stats import IntervalHistogram
+from keyboard_monitor import KeyboardMonitor
+from keystroke_log import KeystrokeLogReader
+from session import TypingSession
+from typewriter import TypeWriter
+from utils import detect_encoding
+
+PATTERNS = ("steady", "poisson", "burst")
+
+
+class FakeClock:
+    # 模拟时钟（纳秒），回放时代替 perf_counter_ns，时间只在 advance/set 时前进
+
+    def __init__(self, start_ns=0):
+        self.now_ns = start_ns
+
+    def __call__(self):
+        return self.now_ns
+
+    def set(self, timestamp_ns):
+        self.now_ns = timestamp_ns
+
+    def advance(self, delta_ns):
+        self.now_ns += delta_ns
+
+
+def synthetic_timeline(pattern="poisson", wpm=60, count=1000, seed=None, start_ns=0,
+                       burst_length=8, burst_speedup=3.0):
+    # 生成 count 次按键的时间戳（纳秒），平均速度约为 wpm（每词 5 个字符）
+    # steady：固定间隔；poisson：间隔服从指数分布；
+    # burst：每 burst_length 次按键为一组，组内以 burst_speedup 倍速连续输入，组间停顿补足平均速度
+    if pattern not in PATTERNS:
+        raise ValueError(f"未知的按键模式: {pattern}")
+    if wpm <= 0:
+        raise ValueError("wpm 必须大于 0")
+
+    rng = random.Random(seed)
+    mean_interval = 60.0 / (wpm * 5)   # 秒
+    now = start_ns
+    timestamps = []
+    for i in range(count):
+        if i:
+            if pattern == "steady":
+                interval = mean_interval
+            elif pattern == "poisson":
+                interval = rng.expovariate(1.0 / mean_interval)
+            elif i % burst_length:
+                interval = rng.expovariate(burst_speedup / mean_interval)
+            else:
+                # 组间停顿：一组的总时长与平均速度下相同
+                pause = mean_interval * burst_length - mean_interval / burst_speedup * (burst_length - 1)
+                interval = rng.expovariate(1.0 / pause)
+            now += int(interval * 1e9)
+        timestamps.append(now)
+    return timestamps
+
+
+class ReplayResult:
+    # 一次回放的结果：保存的记录、统计，以及整条流水线每次按键的处理耗时
+
+    def __init__(self, record, stats, keys, wall_seconds, latency):
+        self.record = record
+        self.stats = stats
+        self.keys = keys                    # 回放的按键次数
+        self.wall_seconds = wall_seconds    # 实际耗时
+        self.latency = latency              # IntervalHistogram：每次按键的处理耗时
+
+    def keys_per_second(self):#实际处理速度（每秒按键数）
+        return self.keys / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def speedup(self):#相对真实时间的倍数（模拟时长 / 实际耗时）
+        return self.stats["time_s"] / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def summary(self):
+        latency = self.latency.percentiles((50, 99))
+        return {
+            "keys": self.keys,
+            "typed_chars": self.stats["chars"],
+            "simulated_s": self.stats["time_s"],
+            "wall_s": round(self.wall_seconds, 4),
+            "keys_per_second": round(self.keys_per_second(), 1),
+            "speedup": round(self.speedup(), 1),
+            "latency_p50_us": round(latency.get(50, 0.0) * 1000, 2),
+            "latency_p99_us": round(latency.get(99, 0.0) * 1000, 2),
+            "wpm_estimated": self.record["wpm_estimated"],
+        }
+
+
+class HeadlessDriver:
+    # 无界面驱动：把按键时间线（录制的或合成的）按模拟时钟送入 TypingSession，
+    # 走与界面相同的 按键 -> TypeWriter -> 统计 -> DataManager 流程，速度只受处理能力限制
+
+    def __init__(self, data_manager, typewriter=None, keyboard_monitor=None, alert_callback=None):
+        self.clock = FakeClock()
+        self.typewriter = typewriter if typewriter is not None else TypeWriter()
+        self.keyboard_monitor = keyboard_monitor if keyboard_monitor is not None else KeyboardMonitor()
+        self.session = TypingSession(self.typewriter, data_manager, self.keyboard_monitor, live=False, clock=self.clock)
+        self.session.alert_callback = alert_callback
+
+    def replay(self, file_path, events, encoding=None, use_mmap=True, start_pos=0):
+        # events 为按键时间戳（纳秒）或 (时间戳, 按键码) 的序列；文件读完时提前结束
+        encoding = encoding or detect_encoding(file_path)
+        if not encoding:
+            raise ValueError(f"无法识别文件编码: {file_path}")
+        self.session.open(file_path, encoding, start_pos=start_pos, use_mmap=use_mmap)
+
+        latency = IntervalHistogram()
+        perf_counter_ns = time.perf_counter_ns
+        key_press = self.session.key_press
+        keys = 0
+        wall_start = perf_counter_ns()
+        for event in events:
+            if isinstance(event, tuple):
+                timestamp_ns, key_code = event
+                key_code = key_code or None
+            else:
+                timestamp_ns, key_code = event, None
+            self.clock.set(timestamp_ns)
+            started = perf_counter_ns()
+            key_press(timestamp_ns, key_code)
+            latency.record(perf_counter_ns() - started)
+            keys += 1
+            if self.session.stopped:
+                break
+        if not self.session.stopped:
+            self.session.finish(finished=False)
+        wall_seconds = (perf_counter_ns() - wall_start) / 1e9
+
+        record, stats = self.session.result
+        self.typewriter.reset()
+        return ReplayResult(record, stats, keys, wall_seconds, latency)
+
+    def replay_log(self, log_path, file_path=None):#回放一次录制的练习（keystroke_log），file_path 默认为录制时的文件
+        reader = KeystrokeLogReader(log_path)
+        try:
+            meta = reader.meta
+            if meta.get("playlist"):
+                raise ValueError("暂不支持回放播放列表的录制")
+            self.session.reveal_mode = meta.get("reveal_mode", "char")
+            # 按录制的时间流式读取，不需要一次读入全部事件
+            events = (timestamp_ns for timestamp_ns, _, _ in reader.iter_events())
+            return self.replay(file_path or meta["file_path"], events, encoding=meta.get("encoding"),
+                               start_pos=meta.get("start_offset", 0))
+        finally:
+            reader.close()
+
+
+def main(argv=None):#命令行：python simulator.py 文本文件 [--pattern burst] [--wpm 80] [--keys 10000]；回放录制：python simulator.py --log 录制.tfkl
+    parser = argparse.ArgumentParser(description="TypeFlow 无界面回放/压力测试")
+    parser.add_argument("file", nargs="?", help="练习用的文本文件（--log 时默认为录制时的文件）")
+    parser.add_argument("--log", help="回放录制的按键文件（.tfkl），代替合成的按键时间线")
+    parser.add_argument("--pattern", default="poisson", choices=PATTERNS, help="按键间隔模式")
+    parser.add_argument("--wpm", type=float, default=60, help="平均速度（每分钟词数）")
+    parser.add_argument("--keys", type=int, default=10000, help="按键次数")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--data-file", default=None, help="保存结果的数据文件（默认使用临时目录）")
+    parser.add_argument("--storage", default="sqlite", choices=("json", "log", "sqlite"), help="存储模式")
+    args = parser.parse_args(argv)
+
+    data_file = args.data_file or os.path.join(tempfile.mkdtemp(), "simulated_data.json")
+    data_manager = DataManager(data_file, storage=args.storage)
+    try:
+        driver = HeadlessDriver(data_manager)
+        if args.log:
+            result = driver.replay_log(args.log, args.file)
+        else:
+            if not args.file:
+                parser.error("需要指定文本文件")
+            events = synthetic_timeline(args.pattern, args.wpm, args.keys, args.seed)
+            result = driver.replay(args.file, events)
+    finally:
+        data_manager.close()
+
+    for key, value in result.summary().items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# speed_window.py
+import threading
+from collections import deque
+
+
+class RollingSpeedWindow:
+    # 滑动窗口速度统计：每个窗口长度一个队列，只保留窗口内的按键时间
+    # 新增按键和查询时只淘汰过期的时间点，均摊 O(1)；内存只与窗口长度有关，与会话时长无关
+
+    def __init__(self, windows=(1, 5, 30), max_keys_per_second=50):
+        self.windows = tuple(sorted(windows))
+        # 每个窗口的队列设置上限，极端情况下（按键速度超过上限）内存也不会增长
+        self.queues = {window: deque(maxlen=int(window * max_keys_per_second))
+                       for window in self.windows}
+        self.total_count = 0    # 会话内按键总数
+        self.start_time = 0     # 会话开始时间，用于计算平均速度
+        self.lock = threading.Lock()
+
+    def reset(self, start_time):#开始新的会话
+        with self.lock:
+            for queue in self.queues.values():
+                queue.clear()
+            self.total_count = 0
+            self.start_time = start_time
+
+    def add(self, key_time):#记录一次按键
+        with self.lock:
+            self.total_count += 1
+            for window, queue in self.queues.items():
+                queue.append(key_time)
+                self._evict(queue, key_time - window)
+
+    def _evict(self, queue, oldest_allowed):#丢掉窗口之外的时间点
+        while queue and queue[0] < oldest_allowed:
+            queue.popleft()
+
+    def count(self, window, now):#最近window秒内的按键次数
+        with self.lock:
+            queue = self.queues[window]
+            self._evict(queue, now - window)
+            return len(queue)
+
+    def next_expiry(self, window):#窗口中最早的按键将在何时移出窗口，窗口为空时为 None
+        with self.lock:
+            queue = self.queues[window]
+            if not queue:
+                return None
+            return queue[0] + window
+
+    def speed(self, window, now):#最近window秒内的速度（字/分钟）
+        return (self.count(window, now) / window) * 60
+
+    def speeds(self, now):#所有窗口的速度 {窗口秒数: 字/分钟}
+        return {window: self.speed(window, now) for window in self.windows}
+
+    def average_speed(self, now):#会话开始以来的平均速度（字/分钟）
+        total_duration = now - self.start_time
+        if total_duration <= 0:
+            return 0
+        return (self.total_count / total_duration) * 60
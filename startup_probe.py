@@ -0,0 +1,116 @@
+# startup_probe.py
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks import _result, compare_results, result_key
+
+# 在子进程中执行，测量从进程启动到窗口第一次绘制完成的时间
+FIRST_PAINT_SCRIPT = """
+import time
+start = time.perf_counter()
+import ttkbootstrap as ttk
+from ui import TypeWriterApp
+root = ttk.Window(themename="cosmo")
+app = TypeWriterApp(root)
+root.update()
+print(round((time.perf_counter() - start) * 1000, 3))
+app.data_manager.close()
+root.destroy()
+"""
+
+
+def _run_python(args, cwd):
+    return subprocess.run([sys.executable] + args, cwd=cwd, capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr):
+    # 解析 -X importtime 的输出，返回 [(模块, 自身微秒, 累计微秒, 层级)]，按输出顺序
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def direct_imports(rows, module):#module 直接导入的模块（输出为后序：子模块在父模块之前）
+    children = []
+    for index, row in enumerate(rows):
+        if row[0] == module and row[3] == 0:
+            for child in reversed(rows[:index]):
+                if child[3] == 0:
+                    break
+                if child[3] == 1:
+                    children.append(child)
+            break
+    return children
+
+
+def probe_imports(module="ui", cwd=None, repeat=3):
+    # 在全新的子进程中导入 module（-X importtime），取 repeat 次中总耗时最短的一次
+    best = None
+    for _ in range(repeat):
+        rows = parse_importtime(_run_python(["-X", "importtime", "-c", f"import {module}"], cwd).stderr)
+        total = sum(self_us for _, self_us, _, _ in rows)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    return best
+
+
+def probe_first_paint(cwd=None, repeat=3):#窗口第一次绘制完成的耗时（毫秒），需要图形界面
+    timings = [float(_run_python(["-c", FIRST_PAINT_SCRIPT], cwd).stdout.strip().splitlines()[-1])
+               for _ in range(repeat)]
+    return min(timings)
+
+
+def run_probe(module="ui", top=15, first_paint=False, cwd=None):#返回与 benchmarks 相同格式的结果文档
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    total_us, rows = probe_imports(module, cwd)
+
+    results = [_result("import_total", {"module": module}, total_us / 1000, "ms", False)]
+    # module 直接导入的包按累计耗时排序，定位启动变慢的来源
+    top_level = sorted(direct_imports(rows, module), key=lambda row: row[2], reverse=True)
+    for name, _, cumulative_us, _ in top_level[:top]:
+        results.append(_result("import_cumulative", {"module": name}, cumulative_us / 1000, "ms", False))
+    if first_paint:
+        results.append(_result("first_paint", {}, probe_first_paint(cwd), "ms", False))
+
+    return {"meta": {"python": sys.version.split()[0], "module": module}, "results": results}
+
+
+def main(argv=None):#命令行：python startup_probe.py [--first-paint] [--output 结果.json] [--baseline 基线.json]
+    parser = argparse.ArgumentParser(description="TypeFlow 启动耗时分析（基于 -X importtime）")
+    parser.add_argument("--module", default="ui", help="要分析的模块（默认 ui）")
+    parser.add_argument("--top", type=int, default=15, help="列出累计耗时最多的几个顶层导入")
+    parser.add_argument("--first-paint", action="store_true", help="同时测量窗口首次绘制耗时（需要图形界面）")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之对比的基线结果 JSON 文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定为退化的变差比例（默认 0.2）")
+    args = parser.parse_args(argv)
+
+    report = run_probe(args.module, args.top, args.first_paint)
+    for result in report["results"]:
+        print(f"{result_key(result):50s} {result['value']:>10.2f} {result['unit']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare_results(report, baseline, args.threshold)
+        for key, base_value, value, change, regressed in rows:
+            print(f"{key:50s} {base_value:>10.2f} -> {value:>10.2f} {change:+7.1%} {'退化' if regressed else ''}")
+        if any(row[4] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
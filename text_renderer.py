@@ -0,0 +1,136 @@
+# text_renderer.py
+import time
+
+from instrumentation import tracer
+
+
+class TextRenderer:
+    # 合并渲染：按键时只把字符放进待显示列表，每帧（约 60 Hz）由 after 回调统一插入一次，
+    # 每次刷新只切换一次只读状态、只滚动一次；超过 max_lines 行或 max_chars 个字符时删掉最前面的内容，
+    # 使 Text 控件的大小（以及自动换行的重排开销）保持有界（没有换行的长段落、中文文本只能按字符数限制）
+    # 控件只是文件的一个窗口：start_offset 记录控件第一个字符在文件中的位置，
+    # 用户向上滚动时用 page_back 按偏移从文件读回更早的内容
+    # widget 需要提供 tk.Text 的 insert/delete/get/see/yview/config/after/after_cancel
+
+    def __init__(self, widget, frame_ms=16, max_lines=2000, max_chars=200000):
+        self.widget = widget
+        self.frame_ms = frame_ms
+        self.max_lines = max_lines
+        self.keep_lines = max(1, max_lines * 3 // 4) # 裁剪后保留的行数，避免每帧都裁剪
+        self.max_chars = max_chars
+        self.keep_chars = max(1, max_chars * 3 // 4) # 按字符数裁剪后保留的字符数
+        self.char_count = 0       # 控件中的字符数
+        self.pending = []         # 等待下一帧显示的文本
+        self.after_id = None      # 已安排的刷新回调
+        self.line_count = 1       # 控件中的行数（与 Text 的行号一致，从 1 开始）
+        self.trimmed_chars = 0    # 已从控件开头删除的字符数
+        self.start_offset = 0     # 控件第一个字符在文件中的字符位置
+        self.flush_count = 0
+        self.pending_since_ns = 0 # 性能记录开启时，本帧第一个待显示字符加入的时间
+
+    def append(self, text):#加入待显示文本，本帧内第一次调用时安排刷新
+        if not text:
+            return
+        if tracer.enabled and not self.pending:
+            self.pending_since_ns = time.perf_counter_ns()
+        self.pending.append(text)
+        if self.after_id is None:
+            self.after_id = self.widget.after(self.frame_ms, self.flush)
+
+    def flush(self):#立即把待显示文本写入控件
+        self.after_id = None
+        if not self.pending:
+            return
+        text = "".join(self.pending)
+        self.pending = []
+        start = time.perf_counter_ns() if tracer.enabled else 0
+
+        self.widget.config(state="normal") # 允许编辑
+        self.widget.insert("end", text)
+        self.line_count += text.count("\n")
+        self.char_count += len(text)
+        self._trim_if_needed()
+        self.widget.see("end") # 自动滚动到最新内容
+        self.widget.config(state="disabled") # 恢复只读
+        self.flush_count += 1
+
+        if start:
+            end = time.perf_counter_ns()
+            tracer.record("text_insert", start, end)
+            if self.pending_since_ns:
+                # 按键处理到字符插入控件的延迟（不含 Tk 之后的绘制）
+                tracer.record("key_to_render", self.pending_since_ns, end)
+        self.pending_since_ns = 0
+
+    def _trim_if_needed(self):#超过行数或字符数上限时裁剪（调用方已设为可编辑）
+        if self.line_count > self.max_lines:
+            self._trim()
+        if self.char_count > self.max_chars:
+            self._trim_chars()
+
+    def _trim(self):#删除最前面的行，只保留 keep_lines 行
+        cut = f"{self.line_count - self.keep_lines + 1}.0"
+        removed = len(self.widget.get("1.0", cut))
+        self._removed(removed)
+        self.widget.delete("1.0", cut)
+        self.line_count = self.keep_lines
+
+    def _trim_chars(self):#删除最前面的字符，只保留 keep_chars 个字符
+        cut = f"1.0 + {self.char_count - self.keep_chars} chars"
+        removed = self.widget.get("1.0", cut)
+        self._removed(len(removed))
+        self.widget.delete("1.0", cut)
+        self.line_count -= removed.count("\n")
+
+    def _removed(self, count):
+        self.trimmed_chars += count
+        self.start_offset += count
+        self.char_count -= count
+
+    def page_back(self, read_range, page_chars=4096):#把控件开头之前的一页（整行）读回控件顶部，返回读回的字符数
+        # read_range(start, end) 按字符偏移读取文件内容（TypeWriter.read_range），不可用时返回 None
+        # 读回的内容最多让控件达到 2 * max_lines 行（或 2 * max_chars 个字符），下一次刷新时会再被裁剪掉
+        if self.start_offset <= 0 or self.line_count >= self.max_lines * 2 or self.char_count >= self.max_chars * 2:
+            return 0
+        start = max(0, self.start_offset - page_chars)
+        text = read_range(start, self.start_offset)
+        if not text:
+            return 0
+        if start > 0:
+            # 丢掉第一行的残缺部分，只读回完整的行
+            newline = text.find("\n")
+            if 0 <= newline < len(text) - 1:
+                text = text[newline + 1:]
+
+        added_lines = text.count("\n")
+        self.widget.config(state="normal")
+        self.widget.insert("1.0", text)
+        self.widget.config(state="disabled")
+        self.widget.yview(f"{added_lines + 1}.0") # 保持用户正在看的那一行不动
+        self.line_count += added_lines
+        self.char_count += len(text)
+        self.start_offset -= len(text)
+        return len(text)
+
+    def set_text(self, text="", start_offset=0):#丢弃待显示内容并用 text 替换控件全部内容，text 从文件的 start_offset 处开始
+        self.cancel()
+        self.widget.config(state="normal")
+        self.widget.delete("1.0", "end")
+        self.widget.insert("end", text)
+        self.line_count = 1 + text.count("\n")
+        self.char_count = len(text)
+        self.trimmed_chars = 0
+        self.start_offset = start_offset
+        self._trim_if_needed()
+        self.widget.see("end")
+        self.widget.config(state="disabled")
+
+    def clear(self):
+        self.set_text("")
+
+    def cancel(self):#取消已安排的刷新并丢弃待显示文本
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+        self.pending = []
+        self.pending_since_ns = 0
@@ -1,40 +1,273 @@
+import threading
+import time
+from bisect import bisect_right
+
+from instrumentation import tracer
+from mapped_reader import MappedTextReader
+from prefetch import ReadAheadReader
+from segment_index import LINE_SEGMENT_MAX, SegmentIndex
+
+_OFFSET_TABLES = {"line": "line_offsets", "word": "word_offsets"}   # 段落模式 -> 缓存读取器中的段首表
+
+
 class TypeWriter:
-    def __init__(self):
+    # chunk_size: 每次补充缓冲区读取的字符数；buffer_size: 普通模式下文件对象的缓冲字节数
+    # prefetch_depth > 0 时由后台线程提前准备好接下来的若干块，按键时不再直接读磁盘
+    # corpus_cache（CorpusCache）不为空时，mmap 模式优先读取预解码的缓存；未缓存时照常打开并在后台生成缓存
+    def __init__(self, chunk_size=4096, buffer_size=8192, prefetch_depth=0, corpus_cache=None):
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.prefetch_depth = prefetch_depth
+        self.corpus_cache = corpus_cache
         self.file_handle = None     # 文件对象（未打开时为 None）
-        self.buffer = ""            # 当前缓冲区内容    
+        self.file_path = None       # 当前文件路径与打开方式，读完后重新定位时用于重新打开
+        self.encoding = None
+        self.use_mmap = False
+        self.buffer = ""            # 当前缓冲区内容
         self.buffer_start_pos = 0   # 缓冲区在文件中的起始位置
         self.current_file_pos = 0   # 当前读取位置
         self.loaded = False         # 是否已加载文件
+        self.segments = SegmentIndex()  # 按词/行/句显示时的分段索引，读入新块时顺带建立
+        self.preopened = None       # preopen() 提前打开的下一个文件：((路径, 编码, use_mmap), 文件对象, 第一块)
+        self.preopen_lock = threading.Lock()
 
-    def open_file(self, file_path, encoding):
-        self.file_handle = open(file_path, "r", encoding=encoding, buffering=8192) # 设置缓冲区大小
-        self.buffer = ""
+    # use_mmap=True 时使用可随机定位的 mmap 读取器；start_pos 用于从上次中断的位置继续
+    def open_file(self, file_path, encoding, use_mmap=False, start_pos=0):
+        self.close()
+        self.file_path = file_path
+        self.encoding = encoding
+        self.use_mmap = use_mmap
+        self.segments.clear()
+        preopened = self._take_preopened(file_path, encoding, use_mmap)
+        if preopened is not None:
+            self.file_handle, self.buffer = preopened # 已提前打开并解码了第一块，不需要等待磁盘
+        else:
+            self._open_handle()
+            self.buffer = ""
         self.buffer_start_pos = 0
         self.current_file_pos = 0
         self.loaded = True
+        if start_pos:
+            self.seek(start_pos)
 
-    # 获取下一个字符
-    def get_next_char(self):
-        if self.file_handle is None:
+    def _open_reader(self, file_path, encoding):#可随机定位的读取器：有缓存时用缓存，否则直接 mmap 原文件
+        if self.corpus_cache is None:
+            return MappedTextReader(file_path, encoding)
+        reader = self.corpus_cache.open(file_path, encoding)
+        if reader is not None:
+            return reader
+        reader = MappedTextReader(file_path, encoding)
+        # 原文件打开成功后再在后台生成缓存，本次打开不需要等待整个文件解码
+        self.corpus_cache.build_in_background(file_path, encoding)
+        return reader
+
+    def _create_handle(self, file_path, encoding, use_mmap):
+        if use_mmap:
+            handle = self._open_reader(file_path, encoding)
+        else:
+            handle = open(file_path, "r", encoding=encoding, buffering=self.buffer_size) # 设置缓冲区大小
+        if self.prefetch_depth > 0:
+            handle = ReadAheadReader(handle, self.chunk_size, self.prefetch_depth)
+        return handle
+
+    def _open_handle(self):
+        self.file_handle = self._create_handle(self.file_path, self.encoding, self.use_mmap)
+
+    # 提前打开下一个文件并解码第一块（可在后台线程调用），之后 open_file 打开同一文件时直接使用
+    def preopen(self, file_path, encoding, use_mmap=False):
+        handle = self._create_handle(file_path, encoding, use_mmap)
+        first_chunk = handle.read(self.chunk_size)
+        with self.preopen_lock:
+            stale = self.preopened
+            self.preopened = ((file_path, encoding, use_mmap), handle, first_chunk)
+        if stale is not None:
+            stale[1].close()
+
+    def _take_preopened(self, file_path, encoding, use_mmap):#取出匹配的预打开文件，返回 (文件对象, 第一块) 或 None
+        with self.preopen_lock:
+            preopened = self.preopened
+            self.preopened = None
+        if preopened is None:
+            return None
+        key, handle, first_chunk = preopened
+        if key != (file_path, encoding, use_mmap):
+            handle.close()
             return None
+        return handle, first_chunk
+
+    # 确保当前位置在缓冲区内，必要时读取下一块；文件读完时返回 False
+    def _fill_buffer(self):
+        if self.file_handle is None:
+            return False
 
         # 是否超出缓冲区范围
         if self.current_file_pos - self.buffer_start_pos >= len(self.buffer):
-            chunk = self.file_handle.read(4096)
+            start = time.perf_counter_ns() if tracer.enabled else 0
+            chunk = self.file_handle.read(self.chunk_size)
+            if start:
+                tracer.record("buffer_refill", start)
             if not chunk:
                 self.close()
-                return None
+                return False
             self.buffer = chunk # 保存新缓冲区内容
             self.buffer_start_pos = self.current_file_pos # 更新缓冲区起始位置
+            if self.segments.tracks:
+                self.segments.feed(self.buffer_start_pos, chunk)
+        return True
+
+    # 获取下一个字符
+    def get_next_char(self):
+        if not self._fill_buffer():
+            return None
 
         idx_in_buffer = self.current_file_pos - self.buffer_start_pos # 计算在缓冲区中的索引
         char = self.buffer[idx_in_buffer] # 弹出当前文字
         self.current_file_pos += 1  # 索引到下一个位置
         return char
 
-    def reset(self):
+    # 一次获取最多 n 个字符（直接切片缓冲区），文件读完时返回空字符串
+    def get_next_chars(self, n):
+        parts = []
+        while n > 0 and self._fill_buffer():
+            idx_in_buffer = self.current_file_pos - self.buffer_start_pos
+            piece = self.buffer[idx_in_buffer:idx_in_buffer + n]
+            parts.append(piece)
+            self.current_file_pos += len(piece)
+            n -= len(piece)
+        return "".join(parts)
+
+    # 一直读到 predicate(字符) 为真的字符（包含该字符）为止，文件读完时返回已读到的部分
+    def read_until(self, predicate):
+        parts = []
+        while self._fill_buffer():
+            idx_in_buffer = self.current_file_pos - self.buffer_start_pos
+            buffer = self.buffer
+            for i in range(idx_in_buffer, len(buffer)):
+                if predicate(buffer[i]):
+                    parts.append(buffer[idx_in_buffer:i + 1])
+                    self.current_file_pos += i + 1 - idx_in_buffer
+                    return "".join(parts)
+            parts.append(buffer[idx_in_buffer:])
+            self.current_file_pos += len(buffer) - idx_in_buffer
+        return "".join(parts)
+
+    # 获取下一段（mode 为 "char"/"word"/"line"/"sentence"），文件读完时返回 None
+    # 段边界由分段索引给出，每次只需查找下一个段首并切片缓冲区；
+    # 读取缓存时逐行、逐词的段首直接查缓存中的行首、词首表，不再扫描文本
+    def get_next_segment(self, mode):
+        if mode == "char":
+            return self.get_next_char()
+        if not self._fill_buffer():
+            return None
+        segment_start = self.current_file_pos
+        boundary = self._table_boundary(mode, segment_start)
+        from_table = boundary is not None
+        if not from_table:
+            idx_in_buffer = self.current_file_pos - self.buffer_start_pos
+            self.segments.track(mode, self.current_file_pos, self.buffer[idx_in_buffer:])
+
+        parts = []
+        while self._fill_buffer():
+            idx_in_buffer = self.current_file_pos - self.buffer_start_pos
+            if not from_table:
+                boundary = self.segments.next_boundary(mode, segment_start)
+            end = boundary - self.buffer_start_pos if boundary is not None else len(self.buffer)
+            end = min(end, len(self.buffer))
+            parts.append(self.buffer[idx_in_buffer:end])
+            self.current_file_pos += end - idx_in_buffer
+            if end < len(self.buffer) or boundary == self.current_file_pos:
+                break
+        return "".join(parts)
+
+    def _table_boundary(self, mode, position):#用缓存中的行首、词首表查 position 之后的第一个段首，没有表时返回 None
+        offsets = getattr(self.file_handle, _OFFSET_TABLES.get(mode, ""), None)
+        if offsets is None:
+            return None
+        i = bisect_right(offsets, position)
+        boundary = offsets[i] if i < len(offsets) else self.file_handle.total_chars
+        if mode == "line" and boundary - position > LINE_SEGMENT_MAX:
+            # 与流式分段相同：超长的行按 LINE_SEGMENT_MAX 个字符切开，紧跟的换行符算在前一段
+            limit = position + LINE_SEGMENT_MAX
+            boundary = limit + 1 if self.file_handle.read_range(limit, limit + 1) == "\n" else limit
+        return boundary
+
+    # 按块返回剩余内容（每次一个字符串切片），回放大文件时最快
+    def iter_chunks(self):
+        while self._fill_buffer():
+            idx_in_buffer = self.current_file_pos - self.buffer_start_pos
+            piece = self.buffer[idx_in_buffer:] if idx_in_buffer else self.buffer
+            self.current_file_pos += len(piece)
+            yield piece
+
+    # 逐字符迭代剩余内容；提前停止迭代时读取位置停在最后一个已返回的字符之后
+    def __iter__(self):
+        while self._fill_buffer():
+            idx_in_buffer = self.current_file_pos - self.buffer_start_pos
+            chunk_start = self.current_file_pos
+            consumed = 0
+            try:
+                for char in self.buffer[idx_in_buffer:]:
+                    consumed += 1
+                    yield char
+            finally:
+                self.current_file_pos = chunk_start + consumed
+
+    # 跳到第 char_index 个字符；mmap 模式下通过稀疏索引定位，普通模式只能从头跳读
+    def seek(self, char_index):
+        if self.file_handle is None:
+            if self.file_path is None:
+                return 0
+            self._open_handle() # 已读完关闭时重新打开
+
+        if getattr(self.file_handle, "supports_char_seek", False):
+            position = self.file_handle.seek(char_index)
+        else:
+            self.file_handle.seek(0)
+            position = 0
+            while position < char_index:
+                skipped = self.file_handle.read(min(65536, char_index - position))
+                if not skipped:
+                    break
+                position += len(skipped)
+
+        self.buffer = ""
+        self.buffer_start_pos = position
+        self.current_file_pos = position
+        return position
+
+    def tell(self):
+        return self.current_file_pos
+
+    # 读取 [start, end) 范围的字符，不改变读取位置（需要 mmap 模式；文件已读完关闭时临时打开）
+    def read_range(self, start, end):
+        if self.file_handle is None and self.use_mmap and self.file_path:
+            reader = self._open_reader(self.file_path, self.encoding)
+            try:
+                return reader.read_range(start, end)
+            finally:
+                reader.close()
+        if not getattr(self.file_handle, "supports_char_seek", False):
+            return None
+        return self.file_handle.read_range(start, end)
+
+    # 回退到当前段落（上一个空行之后）的开头，返回新位置；需要 mmap 模式
+    def rewind_paragraph(self, max_chars=8192):
+        start = max(0, self.current_file_pos - max_chars)
+        text = self.read_range(start, self.current_file_pos)
+        if text is None:
+            return self.current_file_pos
+        # 跳过结尾处的空白，再找上一个空行
+        boundary = text.rstrip().rfind("\n\n")
+        target = start + boundary + 2 if boundary >= 0 else start
+        return self.seek(target)
+
+    def close(self):
         if self.file_handle:
             self.file_handle.close()
             self.file_handle = None
+
+    def reset(self):
+        self.close()
+        self._take_preopened(None, None, None) # 丢弃未使用的预打开文件
         self.current_file_pos = 0
         self.loaded = False
@@ -4,11 +4,19 @@ from tkinter import filedialog, messagebox
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from typewriter import TypeWriter
-from utils import detect_encoding
+from utils import detect_encoding_with_confidence, detect_encoding
+from corpus_cache import CorpusCache
 from data_manager import DataManager
-import time
 import datetime
-from keyboard_monitor import KeyboardMonitor
+import os
+import time
+from session import TypingSession
+from text_renderer import TextRenderer
+from history_view import HistoryTable
+from instrumentation import tracer
+from playlist import Playlist
+
+REVEAL_MODE_LABELS = {"逐字显示": "char", "逐词显示": "word", "逐行显示": "line", "逐句显示": "sentence"}
 
 
 class TypeWriterApp:
@@ -16,35 +24,50 @@ class TypeWriterApp:
         self.root = root
         self.root.title("TypeFlow - 智能打字演示器")
         self.root.geometry("1200x800")
-        self.style = ttk.Style("cosmo")
+        self.style = ttk.Style() # 主题在 main.py 创建窗口时设置，这里不再切换主题
 
         # 核心对象
-        self.typewriter = TypeWriter() # 调用typewriter包
-        self.keyboard_monitor = KeyboardMonitor() # 调用keyboard_monitor包
-        self.data_manager = DataManager() # 调用data_manager包
-
-        # 统计相关
-        self.started = False
-        self.start_time = None
-        self.end_time = None
-        self.typed_chars = 0
-        self.key_events = 0
-        self.stopped = False
+        self.corpus_cache = CorpusCache() # 练习文本的预解码缓存（~/.typeflow/cache），再次打开同一文件时不需要检测编码和解码
+        self.typewriter = TypeWriter(prefetch_depth=4, corpus_cache=self.corpus_cache) # 调用typewriter包（后台预读，按键时不读磁盘）
+        self.keyboard_monitor = None # 第一次有效按键时才导入并创建（连同 pynput），加快启动
+        # 调用data_manager包（SQLite 存储，后台批量写盘；历史在后台线程加载，不阻塞窗口显示）
+        self.data_manager = DataManager(storage="sqlite", write_behind=True, background_load=True)
+
+        # 按键 -> 字符 -> 统计 -> 保存 的核心逻辑（与无界面回放共用）
+        # 默认不录制按键；环境变量 TYPEFLOW_RECORD=1 时录制到用户目录下的 ~/.typeflow/keystroke_logs
+        # （只保留最近 100 次练习），可用 simulator.py --log 回放
+        record_dir = None
+        if os.environ.get("TYPEFLOW_RECORD") == "1":
+            record_dir = os.path.join(os.path.expanduser("~"), ".typeflow", "keystroke_logs")
+        self.session = TypingSession(self.typewriter, self.data_manager, live=True,
+                                     monitor_factory=self._create_keyboard_monitor, record_dir=record_dir)
+        self.session.alert_callback = self.handle_speed_alert # KeyboardMonitor 的提醒回调
+        self.session.file_callback = self.on_playlist_file_change # 播放列表切换文件时更新状态栏
 
         # 顶部工具栏
         top_frame = ttk.Frame(root)
         top_frame.pack(fill=X, padx=10, pady=6)
 
         ttk.Button(top_frame, text="打开文件", command=self.load_text, bootstyle=PRIMARY).pack(side=LEFT, padx=6)
+        ttk.Button(top_frame, text="打开文件夹", command=self.load_playlist, bootstyle=PRIMARY).pack(side=LEFT, padx=6)
         ttk.Button(top_frame, text="聚焦并开始 (按键触发显示)", command=self.focus_textbox, bootstyle=SUCCESS).pack(side=LEFT, padx=6)
         ttk.Button(top_frame, text="停止并统计", command=self.stop_and_show_stats, bootstyle=DANGER).pack(side=LEFT, padx=6)
         ttk.Button(top_frame, text="重置", command=self.reset, bootstyle=INFO).pack(side=LEFT, padx=6)
         ttk.Button(top_frame, text="数据分析 / 历史", command=self.show_data_dashboard, bootstyle=SECONDARY).pack(side=LEFT, padx=6)
+        # 每次按键显示的单位（速读练习可按词、行、句显示）
+        self.reveal_mode_var = tk.StringVar(value="逐字显示")
+        reveal_box = ttk.Combobox(top_frame, textvariable=self.reveal_mode_var, values=list(REVEAL_MODE_LABELS),
+                                  state="readonly", width=10)
+        reveal_box.pack(side=LEFT, padx=6)
+        reveal_box.bind("<<ComboboxSelected>>", self.on_reveal_mode_change)
 
         # 文本显示区
         self.text_box = tk.Text(root, font=("Consolas", 14), wrap="word", bg="#fdfdfd", fg="#333")
         self.text_box.pack(expand=True, fill="both", padx=10, pady=10)
         self.text_box.config(state="disabled")
+        self.renderer = TextRenderer(self.text_box) # 按帧合并插入字符，并限制控件中保留的行数
+        self.text_box.config(yscrollcommand=self._on_text_scroll) # 滚动到顶部时从文件读回更早的内容
+        self.page_back_pending = False
 
         # 状态栏
         self.status = ttk.Label(root, text="就绪", relief="sunken", anchor="w")
@@ -52,15 +75,21 @@ class TypeWriterApp:
 
         # 绑定键事件
         self.text_box.bind("<Key>", self.on_key_press)
+
+        # F12：开启性能记录；已开启时导出统计快照和 Chrome trace
+        self.root.bind("<F12>", self.toggle_tracing)
+
+        # 关闭窗口前写出未保存的数据
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
     
-    def _reset_stats(self):
-        self.started = False
-        self.start_time = None
-        self.end_time = None
-        self.typed_chars = 0
-        self.key_events = 0
-        self.stopped = False
+    def _create_keyboard_monitor(self):
+        from keyboard_monitor import KeyboardMonitor
+        self.keyboard_monitor = KeyboardMonitor() # 调用keyboard_monitor包
+        return self.keyboard_monitor
 
+    def on_reveal_mode_change(self, event=None):#切换显示单位，练习中途也可以切换
+        self.session.reveal_mode = REVEAL_MODE_LABELS[self.reveal_mode_var.get()]
+        self.focus_textbox()
 
     def focus_textbox(self):
         self.text_box.focus_set()
@@ -71,130 +100,140 @@ class TypeWriterApp:
         if not file_path:
             return
 
-        encoding = detect_encoding(file_path)
-        if not encoding:
-            self.status.config(text="无法识别文件编码")
-            return
+        cached = self.corpus_cache.lookup(file_path) # 已缓存且文件未修改时直接使用上次检测的编码
+        if cached:
+            encoding = cached["encoding"]
+            encoding_note = f"编码: {encoding}, 已缓存"
+        else:
+            guess = detect_encoding_with_confidence(file_path) # 单次读取采样，结果按文件缓存
+            if not guess:
+                self.status.config(text="无法识别文件编码")
+                return
+            encoding = guess.encoding
+            encoding_note = f"编码: {encoding}, 置信度: {guess.confidence:.0%}"
+
+        # 上次在该文件中途停止时，询问是否从停止的位置继续
+        start_pos = 0
+        resume_pos = self._find_resume_position(file_path)
+        if resume_pos and messagebox.askyesno("继续练习", f"上次在第 {resume_pos} 个字符处停止，是否从该位置继续？"):
+            start_pos = resume_pos
+
+        # 重置统计并打开文件（mmap 模式，支持随机定位）
+        self.session.open(file_path, encoding, start_pos=start_pos)
+        context = ""
+        if start_pos:
+            # 显示继续位置之前的一小段内容作为上下文，更早的内容向上滚动时再读回
+            context = self.typewriter.read_range(max(0, start_pos - 2000), start_pos) or ""
+        self.renderer.set_text(context, start_offset=start_pos - len(context))
+        self.status.config(text=f"已加载文件: {file_path} ({encoding_note})\n提示：按任意键显示下一个字符。")
+        self.focus_textbox()
 
-        # 重置统计并打开文件
-        self._reset_stats()
-        self.typewriter.open_file(file_path, encoding) # 调用typewriter包
-        self.text_box.config(state="normal")
-        self.text_box.delete("1.0", "end")
-        self.text_box.config(state="disabled")
-        self.status.config(text=f"已加载文件: {file_path} (编码: {encoding})\n提示：按任意键显示下一个字符。")
+    def load_playlist(self):
+        # 选择目录，按名称顺序连续练习其中全部文本文件（一次练习，记录中附带每个文件的统计）
+        directory = filedialog.askdirectory()
+        if not directory:
+            return
+        playlist = Playlist([directory], detect=self._playlist_encoding)
+        if not self.session.open_playlist(playlist):
+            self.status.config(text=f"目录中没有可以打开的文本文件: {directory}")
+            return
+        self.renderer.set_text("")
+        self.status.config(text=f"已加载播放列表: {directory}（共 {len(playlist)} 个文件），当前: {self.session.file_path}\n提示：按任意键显示下一个字符。")
         self.focus_textbox()
 
+    def _playlist_encoding(self, file_path):#播放列表的编码检测（在后台线程调用）：已缓存时不需要读取文件
+        cached = self.corpus_cache.lookup(file_path)
+        return cached["encoding"] if cached else detect_encoding(file_path)
+
+    def on_playlist_file_change(self, file_path, encoding):
+        playlist = self.session.playlist
+        self.status.config(text=f"第 {playlist.position + 1}/{len(playlist)} 个文件: {file_path} (编码: {encoding})")
+
+    def _on_text_scroll(self, first, last):#文本框的 yscrollcommand：视图到达顶部且前面还有内容时，安排读回一页
+        # 播放列表的显示内容来自多个文件，偏移不对应当前文件，不读回
+        if float(first) <= 0.0 and self.renderer.start_offset > 0 and not self.page_back_pending and self.session.playlist is None:
+            self.page_back_pending = True
+            self.root.after_idle(self._page_back)
+
+    def _page_back(self):
+        self.page_back_pending = False
+        self.renderer.page_back(self.typewriter.read_range) # 调用typewriter包（按偏移读取，不影响读取位置）
+
+    def _find_resume_position(self, file_path):#最近一次该文件未完成的测试停在哪个字符
+        for rec in self.data_manager.get_recent_tests(50):
+            if rec.get("file_path") == file_path:
+                if rec.get("finished"):
+                    return 0
+                return rec.get("end_offset", 0)
+        return 0
+
     def on_key_press(self, event):
         # 仅在已加载文件时有效
         if not self.typewriter.loaded: # 调用typewriter包
             return "break"
 
-        if self.stopped:
+        if self.session.stopped:
             return "break"
 
-        ignore_keys = ("BackSpace", "Shift_L", "Shift_R", "Control_L", "Control_R",
-                       "Alt_L", "Tab", "Escape", "Caps_Lock")
-
-        # 第一次有效按键时启动计时与监控
-        if not self.started:
-            self.started = True
-            self.start_time = time.time()
-            self.keyboard_monitor.start_monitoring(self.handle_speed_alert)# 启动 KeyboardMonitor 并传入回调
-            
-        # 记录按键次数（有效）
-        self.key_events += 1
-
-        # 获取下一个字符
-        char = self.typewriter.get_next_char() # 调用typewriter包
+        start = time.perf_counter_ns() if tracer.enabled else 0
+        char = self.session.key_press()
+        if start:
+            tracer.record("on_key_press", start)
+            tracer.count("keys")
         if char is None:
-            # 文件已读完
-            self.end_time = time.time()
-            self.stopped = True
-            self._save_and_show_stats(finished=True)
+            # 文件已读完，会话已结束并保存
+            if self.session.result:
+                self.renderer.flush()
+                self._show_stats(*self.session.result)
             return "break"
 
-        # 将字符插入到只读文本框中
-        self.text_box.config(state="normal") # 允许编辑
-        self.text_box.insert("end", char) # 在末尾插入字符
-        self.text_box.see("end") # 自动滚动到最新内容
-        self.text_box.config(state="disabled") # 恢复只读
-
-        self.typed_chars += 1
+        # 字符先进入待显示列表，下一帧统一插入到只读文本框中
+        self.renderer.append(char)
         return "break"
 
     def stop_and_show_stats(self):
-        if not self.started and not self.typewriter.loaded: # 调用typewriter包
+        if not self.session.started and not self.typewriter.loaded: # 调用typewriter包
             self.status.config(text="没有正在进行的会话，可先打开文件并按键开始。")
             return
 
-        if not self.end_time:
-            self.end_time = time.time()
-        self.stopped = True
-
-        self.keyboard_monitor.stop_monitoring()   # 停止监控
+        self.renderer.flush()                     # 显示还没刷新的字符
+        record, stats = self.session.finish(finished=False) # 停止监控并保存（记录停止位置）
+        self._show_stats(record, stats)
         self.typewriter.reset()# 关闭文件
 
-        self._save_and_show_stats(finished=False)
-
-    def _compute_stats(self):
-        total_time = 0.0
-        if self.start_time and self.end_time:
-            total_time = max(0.0, self.end_time - self.start_time)
-        elif self.start_time and not self.end_time:
-            total_time = max(0.0, time.time() - self.start_time)
-
-        chars = self.typed_chars
-        keys = self.key_events
-        cps = chars / total_time
-        wpm = (chars / 5.0) / (total_time / 60.0)
-
-        return {
-            "chars": chars,
-            "keys": keys,
-            "time_s": round(total_time, 2),
-            "cps": round(cps, 2),
-            "wpm": round(wpm, 2)
-        }
-
-    def _save_and_show_stats(self, finished=False):
-        stats = self._compute_stats()
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # 尝试从 KeyboardMonitor 获取即时速度和按键总数
-        try:
-            current_speed = round(self.keyboard_monitor.get_current_speed(), 2) # 调用keyboard_monitor包
-        except Exception:
-            current_speed = round(stats["cps"] * 60, 2)  # fallback
-
-        try:
-            total_keystrokes = self.keyboard_monitor.get_total_keystrokes() # 调用keyboard_monitor包
-        except Exception:
-            total_keystrokes = stats["keys"]
-
-        test_data = {
-            "timestamp": timestamp,
-            "speed": current_speed,
-            "duration": stats["time_s"],
-            "typed_chars": stats["chars"],
-            "total_keystrokes": total_keystrokes,
-            "wpm_estimated": stats["wpm"]
-        }
-        self.data_manager.save_test(test_data)# 保存到 data_manager
-        
+    def _show_stats(self, record, stats):
         # 构造显示消息并更新状态栏
-        if finished:
+        if record["finished"]:
             title = "完成 — 测试结束"
         else:
             title = "已停止 — 测试中断"
 
         msg = (f"显示字符: {stats['chars']}\n"
                f"用时(秒): {stats['time_s']}\n"
-               f"即时速度(字/分): {current_speed}\n"
+               f"即时速度(字/分): {record['speed']}\n"
                f"估算 WPM: {stats['wpm']}")
+        iki = record["iki"]
+        if iki.get("count"):
+            msg += f"\n按键间隔(ms): P50 {iki['p50_ms']} / P95 {iki['p95_ms']} / P99 {iki['p99_ms']}"
+        for file_stats in record.get("files", [])[:10]:
+            msg += f"\n{file_stats['file_name']}: {file_stats['typed_chars']} 字, {file_stats['duration']} 秒, WPM {file_stats['wpm_estimated']}"
 
         self.status.config(text=msg.replace("\n", " | "))
         self._show_nonblocking_alert(title, msg)
 
+    def toggle_tracing(self, event=None):
+        if not tracer.enabled:
+            tracer.reset()
+            tracer.enable()
+            self.status.config(text="已开启性能记录，再按 F12 导出统计和 trace 文件")
+            return
+        tracer.export_json("typeflow_metrics.json")
+        tracer.export_chrome_trace("typeflow_trace.json")
+        spans = tracer.snapshot()["spans"]
+        latency = spans.get("key_to_render")
+        summary = f"，按键到显示 P50 {latency['p50_ms']}ms / P99 {latency['p99_ms']}ms" if latency else ""
+        self.status.config(text=f"已导出 typeflow_metrics.json 和 typeflow_trace.json{summary}（记录继续）")
+
     def handle_speed_alert(self, title, message):# KeyboardMonitor的回调函数的定义
         self.root.after(0, lambda: self._show_nonblocking_alert(title, message)) # 直接在主线程中显示弹窗
 
@@ -232,52 +271,55 @@ class TypeWriterApp:
 
     # 数据面板
     def show_data_dashboard(self):
-        recent = self.data_manager.get_recent_tests(10) # 调用data_manager包
+        total = self.data_manager.get_total_test_count() # 调用data_manager包
 
         dash = tk.Toplevel(self.root)
         dash.title("TypeFlow — 数据分析 / 历史记录")
-        dash.geometry("700x500")
+        dash.geometry("900x600")
 
         frame = ttk.Frame(dash, padding=10)
         frame.pack(fill="both", expand=True)
 
-        title_label = ttk.Label(frame, text="最近测试记录", font=("Arial", 14, "bold"))
+        title_label = ttk.Label(frame, text=f"全部测试记录（共 {total} 条，点击速度/时长/WPM 列标题排序）", font=("Arial", 14, "bold"))
         title_label.pack(anchor="w", pady=(0, 8))
 
-        if not recent:
+        if not total:
             ttk.Label(frame, text="暂无记录，开始一次测试后会在这里显示", foreground="gray").pack()
             return
 
-        # 滚动显示区域
-        canvas = tk.Canvas(frame, height=360)
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=canvas.yview)
-        scroll_frame = ttk.Frame(canvas)
-
-        scroll_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        canvas.create_window((0, 0), window=scroll_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-
-        for rec in recent:
-            rec_text = (
-                f"时间: {rec.get('timestamp','-')} | "
-                f"即时速度(字/分): {rec.get('speed',0)} | "
-                f"时长(s): {rec.get('duration',0)} | "
-                f"显示字符: {rec.get('typed_chars',0)} | "
-                f"按键总数: {rec.get('total_keystrokes',0)}"
-            )
-            lbl = ttk.Label(scroll_frame, text=rec_text, anchor="w")
-            lbl.pack(fill="x", pady=4)
+        # 分页表格：只读取第一页，滚动到底部时再读取下一页
+        table = HistoryTable(frame, self.data_manager)
+        table.pack(fill="both", expand=True)
+
+        # 每日趋势：只统计最近 7 天（SQLite 按时间索引只读取这部分记录，与历史总量无关）
+        since = (datetime.date.today() - datetime.timedelta(days=6)).strftime("%Y-%m-%d 00:00:00")
+        try:
+            trend = self.data_manager.get_trend("wpm_estimated", bucket="day", start=since)
+        except Exception:
+            trend = []
+        if trend:
+            trend_lines = [
+                f"{row['bucket']}  次数: {row['count']}  平均 WPM: {row['mean']}  "
+                f"中位数: {row['median']}  P90: {row['percentile']}  最高: {row['max']}"
+                for row in trend
+            ]
+            ttk.Label(dash, text="每日趋势（最近 7 天）", font=("Arial", 11, "bold"), padding=(10, 0)).pack(anchor="w")
+            ttk.Label(dash, text="\n".join(trend_lines), justify="left", padding=(10, 4)).pack(anchor="w")
 
         # 底部按钮：清除历史
         btn_frame = ttk.Frame(dash, padding=8)
         btn_frame.pack(fill="x", side="bottom")
         ttk.Button(btn_frame, text="清除全部历史数据", bootstyle="danger-outline", command=lambda: self._confirm_clear_history(dash)).pack(side="right")
+        ttk.Button(btn_frame, text="统计报告", bootstyle="info-outline", command=self.show_analytics_report).pack(side="right", padx=6)
+
+    def show_analytics_report(self):#读取全部历史做批量统计（点击时才计算，打开面板不受影响）
+        from analytics import HistoryColumns, summarize, format_report # 可能导入 NumPy，用到时才导入
+        history = HistoryColumns.from_data_manager(self.data_manager) # 调用analytics包
+        report = "\n\n".join(format_report(summarize(history, metric)) for metric in history.series)
+
+        window = tk.Toplevel(self.root)
+        window.title("TypeFlow — 统计报告")
+        ttk.Label(window, text=report, justify="left", font=("Consolas", 10), padding=12).pack(anchor="w")
 
     def _confirm_clear_history(self, window_to_close=None):
         confirmed = messagebox.askyesno("确认", "确定要清除所有历史测试数据吗？此操作不可撤销。")
@@ -296,9 +338,13 @@ class TypeWriterApp:
     def reset(self):
         self.typewriter.reset()
 
-        self.text_box.config(state="normal")
-        self.text_box.delete("1.0", "end")
-        self.text_box.config(state="disabled")
+        self.renderer.clear()
         self.status.config(text="已重置")
-        self._reset_stats()
-        self.stopped = False
+        self.session.reset()
+
+    def on_close(self):
+        if self.session.started and not self.session.stopped and self.keyboard_monitor is not None:
+            self.keyboard_monitor.stop_monitoring()
+        self.data_manager.close() # 等待后台线程把剩余记录写盘
+        self.corpus_cache.close() # 保存缓存的最近使用时间
+        self.root.destroy()
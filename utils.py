@@ -1,12 +1,153 @@
 # 补丁
-def detect_encoding(file_path):
-    """尝试检测文件编码"""
-    encodings = ["utf-8", "gbk", "gb2312", "latin1"]
-    for enc in encodings:
+import codecs
+import os
+import re
+from collections import OrderedDict, namedtuple
+
+# 检测结果：编码名称与置信度（0~1）
+EncodingGuess = namedtuple("EncodingGuess", ["encoding", "confidence"])
+
+# 候选编码，按优先级排列
+CANDIDATE_ENCODINGS = ["utf-8", "gbk", "gb2312", "latin1"]
+
+# BOM 与对应的编码（UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头，必须先判断）
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+SAMPLE_SIZE = 1 << 20   # 从文件开头读取的最大字节数
+TAIL_SIZE = 1 << 16     # 文件大于采样范围时，额外检查文件末尾的字节数
+BLOCK_SIZE = 1 << 16    # 每次交给解码器的字节数
+
+# 检测结果缓存：(绝对路径, 文件大小, 修改时间) -> EncodingGuess
+_encoding_cache = OrderedDict()
+_CACHE_LIMIT = 256
+
+# 用正则在 C 层统计字符，避免在 Python 中逐字符循环
+_NON_CJK_RE = re.compile("[^\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]+")
+_CONTROL_RE = re.compile("[\x00-\x08\x0e-\x19\x1b-\x1f\x7f-\x9f]")
+
+
+class _CandidateStats:
+    # 一个候选编码的增量解码器和解码出的字符统计
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.chars = 0
+        self.non_ascii = 0
+        self.cjk = 0
+        self.controls = 0
+
+    def feed(self, data, final):#解码一块数据并更新统计，解码失败时抛出 UnicodeDecodeError
+        text = self.decoder.decode(data, final)
+        self.chars += len(text)
+        self.non_ascii += len(text) - len(text.encode("ascii", "ignore"))
+        self.cjk += len(_NON_CJK_RE.sub("", text))
+        self.controls += len(_CONTROL_RE.findall(text))
+
+    def confidence(self):#根据解码出的内容估计置信度
+        if self.chars == 0:
+            return 1.0 if self.encoding == "utf-8" else 0.0
+        # 控制字符过多时视为二进制数据
+        if self.controls > self.chars * 0.01:
+            return 0.0
+        if self.encoding in ("utf-8-sig", "utf-16", "utf-32"):
+            # 由 BOM 确定的编码
+            return 1.0
+        if self.encoding == "utf-8":
+            # 合法的多字节 UTF-8 序列很难偶然出现
+            return 1.0 if self.non_ascii == 0 else 0.99
+        if self.encoding in ("gbk", "gb2312"):
+            if self.non_ascii == 0:
+                return 0.9
+            return 0.5 + 0.49 * self.cjk / self.non_ascii
+        # latin1 能解码任何字节，只能作为兜底
+        return 0.2
+
+
+def _tail_decodes(encoding, tail):#检查文件末尾的一段是否能被该编码解码（开头可能截断了多字节字符）
+    for skip in range(4):
         try:
-            with open(file_path, "r", encoding=enc) as f:
-                f.read(1024) # 试读一点
-            return enc
+            tail[skip:].decode(encoding)
+            return True
         except UnicodeDecodeError:
             continue
-    return None
+    return False
+
+
+def detect_encoding_with_confidence(file_path, sample_size=SAMPLE_SIZE):
+    """单次读取文件检测编码，返回 EncodingGuess，无法识别时返回 None"""
+    stat = os.stat(file_path)
+    cache_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if cache_key in _encoding_cache:
+        _encoding_cache.move_to_end(cache_key)
+        return _encoding_cache[cache_key]
+
+    guess = _detect(file_path, stat.st_size, sample_size)
+
+    _encoding_cache[cache_key] = guess
+    if len(_encoding_cache) > _CACHE_LIMIT:
+        _encoding_cache.popitem(last=False)
+    return guess
+
+
+def _detect(file_path, file_size, sample_size):
+    whole_file = file_size <= sample_size
+    with open(file_path, "rb") as f:
+        head = f.read(4)
+        f.seek(0)
+
+        # 有 BOM 时直接确定编码，只需验证内容能否解码
+        for bom, encoding in BOMS:
+            if head.startswith(bom):
+                candidates = [_CandidateStats(encoding)]
+                break
+        else:
+            candidates = [_CandidateStats(enc) for enc in CANDIDATE_ENCODINGS]
+
+        allow_nul = candidates[0].encoding in ("utf-16", "utf-32")
+
+        # 所有候选解码器一起增量处理同一份采样
+        read_bytes = 0
+        while candidates and read_bytes < sample_size:
+            block = f.read(min(BLOCK_SIZE, sample_size - read_bytes))
+            read_bytes += len(block)
+            final = not block or (whole_file and read_bytes >= file_size)
+            if b"\x00" in block and not allow_nul:
+                # 除 UTF-16/32 外，文本文件不会出现 NUL 字节
+                return None
+            survivors = []
+            for candidate in candidates:
+                try:
+                    candidate.feed(block, final)
+                    survivors.append(candidate)
+                except UnicodeDecodeError:
+                    pass
+            candidates = survivors
+            if final:
+                break
+
+        if candidates and not whole_file:
+            f.seek(max(read_bytes, file_size - TAIL_SIZE))
+            tail = f.read()
+            candidates = [c for c in candidates if _tail_decodes(c.encoding, tail)]
+
+    best = None
+    for candidate in candidates:
+        confidence = candidate.confidence()
+        if not whole_file:
+            confidence *= 0.95   # 只检查了部分内容
+        if confidence > 0 and (best is None or confidence > best.confidence):
+            best = EncodingGuess(candidate.encoding, round(confidence, 3))
+    return best
+
+
+def detect_encoding(file_path):
+    """尝试检测文件编码"""
+    guess = detect_encoding_with_confidence(file_path)
+    return guess.encoding if guess else None
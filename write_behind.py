@@ -0,0 +1,107 @@
+# write_behind.py
+import threading
+import time
+
+
+class WriteBehindWriter:
+    # 后台持久化线程：save 只把记录放进内存队列，后台线程把多条记录合并成一批再写盘
+    # 每批写完后由 write_batch 负责 fsync，因此批次边界即为持久化边界
+    # 写入失败的批次记下其序号范围，等待这些序号（或之后的序号）时返回 False
+
+    def __init__(self, write_batch, flush_interval=0.5, batch_size=64):
+        self.write_batch = write_batch          # 写入一批记录的函数（写入并 fsync）
+        self.flush_interval = flush_interval    # 第一条记录进入队列后最多等待多久就写盘（秒）
+        self.batch_size = batch_size            # 攒够多少条立即写盘
+
+        self.pending = []
+        self.condition = threading.Condition()
+        self.submitted_count = 0    # 已提交的记录数（同时作为序号）
+        self.durable_count = 0      # 已处理完（写盘成功或失败）的记录数
+        self.batches_written = 0
+        self.failed_ranges = []     # 写盘失败的批次：(第一条序号, 最后一条序号)
+        self.last_error = None      # 最近一次写盘失败的异常
+        self.flush_requested = False
+        self.closing = False
+
+        self.worker_thread = threading.Thread(target=self._run, daemon=True)
+        self.worker_thread.start()
+
+    def submit(self, record):#提交一条记录，立即返回它的序号
+        with self.condition:
+            if self.closing:
+                raise RuntimeError("写入线程已关闭")
+            self.pending.append(record)
+            self.submitted_count += 1
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify_all()
+            elif len(self.pending) == 1:
+                # 唤醒后台线程开始计时
+                self.condition.notify_all()
+            return self.submitted_count
+
+    def pending_count(self):
+        with self.condition:
+            return len(self.pending)
+
+    def _run(self):#后台线程：等待攒批或超时，然后写盘
+        while True:
+            with self.condition:
+                while not self.pending and not self.closing:
+                    self.condition.wait()
+                if not self.pending and self.closing:
+                    return
+
+                deadline = time.monotonic() + self.flush_interval
+                while (len(self.pending) < self.batch_size and not self.flush_requested
+                       and not self.closing):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                batch = self.pending[:self.batch_size]
+                del self.pending[:self.batch_size]
+                if not self.pending:
+                    self.flush_requested = False
+
+            try:
+                self.write_batch(batch)
+                error = None
+            except Exception as exc:
+                print(f"保存数据时出错: {exc}")
+                error = exc
+
+            with self.condition:
+                # 只有一个后台线程按顺序写出，本批的序号紧接在已处理的记录之后
+                first = self.durable_count + 1
+                self.durable_count += len(batch)
+                if error is None:
+                    self.batches_written += 1
+                else:
+                    self.failed_ranges.append((first, self.durable_count))
+                    self.last_error = error
+                self.condition.notify_all()
+
+    def wait_durable(self, sequence=None, timeout=None):#等待序号为sequence（默认为目前全部）的记录写盘
+        # 返回 True 表示序号不超过sequence的记录都已经写入并 fsync，其中没有写盘失败的
+        with self.condition:
+            if sequence is None:
+                sequence = self.submitted_count
+            done = self.condition.wait_for(lambda: self.durable_count >= sequence, timeout)
+            return done and not any(first <= sequence for first, _ in self.failed_ranges)
+
+    def flush(self, timeout=None):#立即写出队列中的所有记录并等待完成
+        with self.condition:
+            sequence = self.submitted_count
+            if self.pending:
+                self.flush_requested = True
+                self.condition.notify_all()
+        return self.wait_durable(sequence, timeout)
+
+    def close(self, timeout=None):#写出剩余记录并停止后台线程
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.worker_thread.join(timeout)
+        with self.condition:
+            return not self.pending and not self.failed_ranges